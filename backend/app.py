@@ -7,8 +7,10 @@ import threading
 import time
 import logging
 from datetime import datetime
-from shot_detector_video import BasketballShotDetector
 from video_processor import VideoProcessor
+from model_pool import init_model_pool, get_model_pool
+from detection_cache import DetectionCache
+from shot_detector_video import BasketballShotDetector
 
 # 配置日志
 logging.basicConfig(
@@ -28,11 +30,16 @@ CORS(app)
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 TEMP_FOLDER = 'temp'
+CACHE_FOLDER = 'cache'
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 MAX_FILE_SIZE = 500 * 1024 * 1024  # 500MB
+MODEL_PATH = 'best.pt'
+MODEL_POOL_SIZE = 2  # 预加载的检测器数量，即最多同时进行的检测任务数
+DETECTION_CACHE_MAX_BYTES = 50 * 1024 * 1024  # 检测结果缓存上限 50MB
+TIMING_UPDATE_INTERVAL = 2  # 检测进行中刷新分阶段计时的最小间隔（秒）
 
 # 创建必要的目录
-for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_FOLDER]:
+for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, TEMP_FOLDER, CACHE_FOLDER]:
     os.makedirs(folder, exist_ok=True)
     logger.info(f"确保目录存在: {folder}")
 
@@ -40,6 +47,12 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['TEMP_FOLDER'] = TEMP_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+app.config['MODEL_PATH'] = MODEL_PATH
+app.config['MODEL_POOL_SIZE'] = MODEL_POOL_SIZE
+app.config['CACHE_FOLDER'] = CACHE_FOLDER
+
+# 检测结果缓存（按视频内容、模型和检测参数寻址）
+detection_cache = DetectionCache(CACHE_FOLDER, DETECTION_CACHE_MAX_BYTES)
 
 # 全局任务存储
 processing_tasks = {}
@@ -208,6 +221,7 @@ def process_video():
             'stage': '准备处理',
             'result': None,
             'error': None,
+            'timings': None,
             'created_at': time.time(),
             'file_id': file_id,
             'input_path': input_path,
@@ -256,31 +270,71 @@ def process_video_background(task_id, input_path, before_seconds, after_seconds)
         )
         
         # 检查模型文件是否存在
-        model_path = 'best.pt'
+        model_path = app.config['MODEL_PATH']
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"AI模型文件不存在: {model_path}")
         
-        # 初始化检测器
-        logger.info(f"初始化篮球检测器，模型: {model_path}")
-        detector = BasketballShotDetector(model_path=model_path)
+        # 获取模型池（服务启动时未预加载则在此初始化）
+        pool = init_model_pool(model_path, app.config['MODEL_POOL_SIZE'])
+        
+        # 检测中的检测器，用于定期把分阶段计时刷新到任务进度
+        timing_state = {'detector': None, 'updated_at': 0.0}
         
         # 进度回调函数
         def progress_callback(current_frame, total_frames):
             if task_id in processing_tasks:
                 progress = 10 + int((current_frame / total_frames) * 60)  # 10-70%
+                extra = {}
+                detector = timing_state['detector']
+                if detector is not None and time.time() - timing_state['updated_at'] >= TIMING_UPDATE_INTERVAL:
+                    timing_state['updated_at'] = time.time()
+                    extra['timings'] = {'detection': detector.timing_summary(), 'video': None}
                 update_task_progress(task_id,
                     progress=progress,
-                    stage=f'正在分析视频... ({current_frame}/{total_frames})'
+                    stage=f'正在分析视频... ({current_frame}/{total_frames})',
+                    **extra
                 )
         
-        # 检测进球
-        logger.info(f"开始检测进球，文件: {input_path}")
-        result = detector.detect_shots_with_clips(
-            input_path, 
-            before_seconds=before_seconds, 
-            after_seconds=after_seconds,
-            progress_callback=progress_callback
-        )
+        # 查询检测结果缓存，命中时跳过检测直接生成集锦
+        update_task_progress(task_id, stage='正在计算视频指纹...')
+        cache_key = detection_cache.make_key(input_path, model_path, pool.signature)
+        cached = detection_cache.get(cache_key)
+        
+        if cached is not None:
+            logger.info(f"检测结果缓存命中: {cache_key[:12]}")
+            result = BasketballShotDetector.summarize_shots(
+                input_path,
+                cached['shots'],
+                before_seconds=before_seconds,
+                after_seconds=after_seconds
+            )
+        else:
+            # 检测进球（从模型池借出检测器，完成后自动归还）
+            if pool.available() == 0:
+                update_task_progress(task_id, stage='等待空闲检测模型...')
+            
+            # 检查点按缓存键命名：进程中途退出后，重新提交同一视频会从上次的检查点继续
+            checkpoint_dir = os.path.join(app.config['TEMP_FOLDER'], 'checkpoints')
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            checkpoint_path = os.path.join(checkpoint_dir, f"{cache_key}.json")
+            
+            with pool.checkout() as detector:
+                timing_state['detector'] = detector
+                logger.info(f"开始检测进球，文件: {input_path}")
+                result = detector.detect_shots_with_clips(
+                    input_path, 
+                    before_seconds=before_seconds, 
+                    after_seconds=after_seconds,
+                    progress_callback=progress_callback,
+                    checkpoint_path=checkpoint_path
+                )
+            
+            timing_state['detector'] = None
+            detection_cache.put(cache_key, result['shots'], result['stats'])
+        
+        # 检测阶段计时（缓存命中时没有检测，为 None）
+        timings = {'detection': result.get('timings'), 'video': None}
+        update_task_progress(task_id, timings=timings)
         
         logger.info(f"检测完成，结果: 总投篮 {result['stats']['total_attempts']}, 进球 {result['stats']['total_makes']}, 命中率 {result['stats']['accuracy']:.1f}%")
         
@@ -309,6 +363,9 @@ def process_video_background(task_id, input_path, before_seconds, after_seconds)
                 after=after_seconds
             )
             
+            timings['video'] = video_result['timings']
+            update_task_progress(task_id, timings=timings)
+            
             if not video_result['success']:
                 raise Exception(video_result['error'])
             
@@ -330,7 +387,8 @@ def process_video_background(task_id, input_path, before_seconds, after_seconds)
                     'accuracy': result['stats']['accuracy'],
                     'highlightVideo': output_filename,
                     'timestamps': result['made_shots'],
-                    'fileSize': file_size
+                    'fileSize': file_size,
+                    'timings': timings
                 }
             )
         else:
@@ -345,7 +403,8 @@ def process_video_background(task_id, input_path, before_seconds, after_seconds)
                     'madeShots': result['stats']['total_makes'],
                     'accuracy': result['stats']['accuracy'],
                     'highlightVideo': None,
-                    'message': '未检测到进球，请检查视频内容或调整参数'
+                    'message': '未检测到进球，请检查视频内容或调整参数',
+                    'timings': timings
                 }
             )
         
@@ -388,6 +447,10 @@ def get_progress(task_id):
             'completed': task['status'] in ['completed', 'failed']
         }
         
+        # 分阶段计时：检测各阶段每帧 p50/p95、总耗时、有效帧率，以及每个片段的 FFmpeg 耗时
+        if task.get('timings'):
+            response['timings'] = task['timings']
+        
         if task['status'] == 'completed' and task['result']:
             response['result'] = task['result']
         elif task['status'] == 'failed' and task['error']:
@@ -451,11 +514,18 @@ def health_check():
             'components': {
                 'upload_folder': os.path.exists(UPLOAD_FOLDER),
                 'output_folder': os.path.exists(OUTPUT_FOLDER),
-                'model_file': os.path.exists('best.pt'),
+                'model_file': os.path.exists(MODEL_PATH),
                 'active_tasks': len(processing_tasks)
             }
         }
         
+        pool = get_model_pool()
+        health_status['model_pool'] = {
+            'size': pool.size if pool else 0,
+            'available': pool.available() if pool else 0
+        }
+        health_status['detection_cache'] = detection_cache.stats()
+        
         # 检查是否有组件异常
         if not all(health_status['components'].values()):
             health_status['status'] = 'degraded'
@@ -499,6 +569,11 @@ def start_cleanup_timer():
 
 if __name__ == '__main__':
     start_cleanup_timer()
+    
+    # 预加载模型池；debug 模式下 reloader 会先启动一个监控进程，只在实际服务的子进程中加载
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and os.path.exists(MODEL_PATH):
+        logger.info(f"预加载检测模型池: {MODEL_POOL_SIZE} 个, 模型: {MODEL_PATH}")
+        init_model_pool(MODEL_PATH, MODEL_POOL_SIZE)
     logger.info("🏀 篮球集锦生成服务启动中...")
     logger.info("📡 API服务地址: http://localhost:5000")
     logger.info("📋 健康检查: http://localhost:5000/api/health")
@@ -0,0 +1,298 @@
+# ball_kalman.py - 篮球轨迹卡尔曼滤波
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# 二维卡方分布的 99% 分位数：马氏距离平方超过该值的检测框不属于当前轨迹
+GATE_CHI2_99 = 9.21
+
+# 检测框与预测位置的最大距离（球直径的倍数）
+MAX_MATCH_DIAMETERS = 2.0
+
+# 观测矩阵：状态 [x, vx, ax, y, vy, ay] 中只能观测到位置
+_H = np.zeros((2, 6))
+_H[0, 0] = 1.0
+_H[1, 3] = 1.0
+
+
+class BallKalmanFilter:
+    """
+    匀加速模型的篮球卡尔曼滤波器
+
+    状态为 [x, vx, ax, y, vy, ay]，时间单位为帧（飞行中的球只受重力，
+    匀加速模型足以描述抛物线）。每帧输入候选检测框：
+    先预测到当前帧，再按马氏距离门限挑选最匹配的候选框更新；
+    没有匹配的候选框（漏检或该帧未推理）时输出预测位置，
+    连续 max_coast_frames 帧未更新则认为轨迹丢失。
+
+    门限外的候选框组成待确认的候选链（相邻两框的距离和速度变化都要像同一个球）。
+    候选链连续 confirm_hits 个检测框后才开始新轨迹，单个误检不会产生轨迹；
+    当前轨迹在候选链期间一直没有更新（例如球碰筐后突然改变方向）时，
+    同样用候选链重新开始轨迹，不再继续外推旧轨迹。
+    最近一次检测之后 bridge_frames 帧内的预测位置用于补齐漏检或未推理的帧，参与投篮判定。
+
+    噪声按球的直径归一化，对不同分辨率的视频使用同一组参数
+    """
+
+    def __init__(self, measurement_noise=0.1, process_noise=0.05,
+                 gate=GATE_CHI2_99, max_coast_frames=10, confirm_hits=3, max_chain_gap=5,
+                 bridge_frames=5):
+        """
+        初始化滤波器
+
+        Args:
+            measurement_noise: 检测框中心的观测标准差（球直径的倍数）
+            process_noise: 加加速度的标准差（球直径的倍数 / 帧³）
+            gate: 马氏距离平方门限
+            max_coast_frames: 没有检测框更新时最多外推的帧数
+            confirm_hits: 开始（或重新开始）一条轨迹需要的连续一致检测框数
+            max_chain_gap: 候选链连续多少个推理帧没有接上检测框后丢弃（未推理的帧不计）
+            bridge_frames: 最近一次检测之后多少帧内的预测位置可以参与投篮判定；
+                更久的外推只用于补齐轨迹（球可能已经碰筐改变方向）
+        """
+        self.measurement_noise = measurement_noise
+        self.process_noise = process_noise
+        self.gate = gate
+        self.max_coast_frames = max_coast_frames
+        self.confirm_hits = confirm_hits
+        self.max_chain_gap = max_chain_gap
+        self.bridge_frames = bridge_frames
+        self.chains = []
+        self.reset()
+
+    def reset(self):
+        """丢弃当前轨迹"""
+        self.x = None
+        self.P = None
+        self.frame = None
+        self.last_update = None
+        self.size = (0, 0)
+
+    @property
+    def active(self) -> bool:
+        return self.x is not None
+
+    def _diameter(self) -> float:
+        return max(1.0, (self.size[0] + self.size[1]) / 2)
+
+    def _measurement_cov(self) -> np.ndarray:
+        return np.eye(2) * (self.measurement_noise * self._diameter()) ** 2
+
+    @staticmethod
+    def _transition(dt) -> np.ndarray:
+        block = np.array([[1.0, dt, dt * dt / 2],
+                          [0.0, 1.0, dt],
+                          [0.0, 0.0, 1.0]])
+        F = np.zeros((6, 6))
+        F[0:3, 0:3] = block
+        F[3:6, 3:6] = block
+        return F
+
+    def _process_cov(self, dt) -> np.ndarray:
+        # 白噪声加加速度模型的离散化过程噪声
+        block = np.array([[dt ** 5 / 20, dt ** 4 / 8, dt ** 3 / 6],
+                          [dt ** 4 / 8, dt ** 3 / 3, dt ** 2 / 2],
+                          [dt ** 3 / 6, dt ** 2 / 2, dt]])
+        block *= (self.process_noise * self._diameter()) ** 2
+        Q = np.zeros((6, 6))
+        Q[0:3, 0:3] = block
+        Q[3:6, 3:6] = block
+        return Q
+
+    def initiate(self, center, size, frame):
+        """从一个检测框开始新轨迹：速度和加速度未知，给较大的初始方差"""
+        self.size = size
+        d = self._diameter()
+        self.x = np.array([center[0], 0.0, 0.0, center[1], 0.0, 0.0])
+        variances = [(self.measurement_noise * d) ** 2, (2 * d) ** 2, (0.5 * d) ** 2]
+        self.P = np.diag(variances + variances)
+        self.frame = frame
+        self.last_update = frame
+
+    def predict(self, frame):
+        """把状态外推到指定帧"""
+        dt = frame - self.frame
+        if dt <= 0:
+            return
+        F = self._transition(dt)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + self._process_cov(dt)
+        self.frame = frame
+
+    def mahalanobis(self, centers) -> np.ndarray:
+        """候选位置与预测位置之间的马氏距离平方"""
+        innovation = np.asarray(centers, dtype=np.float64) - (_H @ self.x)
+        S = _H @ self.P @ _H.T + self._measurement_cov()
+        return np.einsum('ni,ij,nj->n', innovation, np.linalg.inv(S), innovation)
+
+    def update(self, center, size):
+        """用一个检测框更新当前帧的状态"""
+        self.size = size
+        S = _H @ self.P @ _H.T + self._measurement_cov()
+        K = self.P @ _H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (np.asarray(center, dtype=np.float64) - _H @ self.x)
+        self.P = (np.eye(6) - K @ _H) @ self.P
+        self.last_update = self.frame
+
+    @staticmethod
+    def _extends(chain, entry) -> bool:
+        """候选框能否接在候选链末尾：距离、大小和速度变化都要像同一个球"""
+        last = chain[-1]
+        gap = entry[1] - last[1]
+        if gap <= 0:
+            return False
+
+        # 与 clean_ball_pos 相同的规则：球在 5 帧内移动不会超过 4 倍直径
+        # （隔帧推理时两个检测框可能相隔更多帧，按间隔放宽）
+        w, h = last[2], last[3]
+        dx = entry[0][0] - last[0][0]
+        dy = entry[0][1] - last[0][1]
+        scale = max(1.0, gap / 5)
+        if dx * dx + dy * dy > 16 * (w * w + h * h) * scale * scale:
+            return False
+        if not (w / 1.4 < entry[2] < w * 1.4 and h / 1.4 < entry[3] < h * 1.4):
+            return False
+
+        # 有两个以上检测框时，前后两段的平均速度（每帧）相差不超过半个球的直径
+        # （两段相隔越久，重力造成的速度变化越大，同样按间隔放宽）
+        if len(chain) > 1:
+            prev = chain[-2]
+            prev_gap = last[1] - prev[1]
+            dvx = dx / gap - (last[0][0] - prev[0][0]) / prev_gap
+            dvy = dy / gap - (last[0][1] - prev[0][1]) / prev_gap
+            scale = max(1.0, (gap + prev_gap) / 10)
+            if dvx * dvx + dvy * dvy > (w + h) * (w + h) / 16 * scale * scale:
+                return False
+        return True
+
+    @staticmethod
+    def _chain_distance(chain, entry) -> float:
+        """候选框与候选链按匀速外推到该帧的位置之间的距离"""
+        last = chain[-1]
+        x, y = last[0]
+        if len(chain) > 1:
+            prev = chain[-2]
+            scale = (entry[1] - last[1]) / (last[1] - prev[1])
+            x += (last[0][0] - prev[0][0]) * scale
+            y += (last[0][1] - prev[0][1]) * scale
+        return float(np.hypot(entry[0][0] - x, entry[0][1] - y))
+
+    def _associate(self, frame, candidates):
+        """把当前轨迹门限外的候选框接到候选链上，返回已确认的候选链（没有时返回 None）"""
+        for chain in self.chains:
+            chain['misses'] += 1
+        for entry in sorted(candidates, key=lambda entry: -entry[4]):
+            # 能接上的候选链中选外推位置离候选框最近的一条
+            extendable = [chain for chain in self.chains
+                          if chain['entries'][-1][1] < frame and self._extends(chain['entries'], entry)]
+            if extendable:
+                chain = min(extendable, key=lambda chain: self._chain_distance(chain['entries'], entry))
+                chain['entries'].append(entry)
+                chain['misses'] = 0
+            else:
+                self.chains.append({'entries': [entry], 'misses': 0})
+        self.chains = [chain for chain in self.chains if chain['misses'] < self.max_chain_gap]
+
+        confirmed = [chain['entries'] for chain in self.chains
+                     if len(chain['entries']) >= self.confirm_hits]
+        if not confirmed:
+            return None
+        return max(confirmed, key=lambda entries: (len(entries), sum(entry[4] for entry in entries)))
+
+    def _entry(self, frame, conf) -> tuple:
+        """当前状态的位置记录 ((x, y), frame, w, h, conf)"""
+        center = (int(round(self.x[0])), int(round(self.x[3])))
+        return center, frame, self.size[0], self.size[1], conf
+
+    def _start(self, chain) -> List[tuple]:
+        """用确认的候选链开始新轨迹：从第一个检测框初始化，依次用其余检测框更新，返回滤波后的位置记录"""
+        first = chain[0]
+        self.initiate(first[0], (first[2], first[3]), first[1])
+        entries = [first]
+        for entry in chain[1:]:
+            self.predict(entry[1])
+            self.update(entry[0], (entry[2], entry[3]))
+            entries.append(self._entry(entry[1], entry[4]))
+        self.chains = []
+        return entries
+
+    def step(self, frame, candidates: Optional[List]) -> Tuple[List[tuple], bool]:
+        """
+        处理一帧
+
+        Args:
+            frame: 当前帧序号（必须递增）
+            candidates: 本帧的篮球位置记录 [((x, y), frame, w, h, conf), ...]，可以为空；
+                None 表示该帧未推理（不计入候选链的间隔）
+
+        Returns:
+            (位置记录列表, 是否开始了新轨迹)
+
+            - 当前轨迹匹配到检测框：滤波后的位置记录 ((x, y), frame, w, h, conf)，conf 为检测框的置信度
+            - 当前轨迹没有匹配（漏检或未推理）：预测位置的记录，conf 为 0
+            - 候选链确认后开始新轨迹：候选链每个检测框对应的滤波后位置（帧号可能早于当前帧），
+              调用方应丢弃这段时间内旧轨迹外推出的位置
+            - 没有活动轨迹：空列表
+        """
+        if self.active and frame - self.last_update > self.max_coast_frames:
+            self.reset()
+
+        matched = None
+        unmatched = candidates
+        if self.active:
+            self.predict(frame)
+            if candidates:
+                centers = [entry[0] for entry in candidates]
+                d2 = self.mahalanobis(centers)
+                best = int(np.argmin(d2))
+                # 外推多帧后预测的方差很大，马氏距离门限会接受很远的检测框（如碰筐后改变方向的球），
+                # 再限制与预测位置的距离不超过 MAX_MATCH_DIAMETERS 个球的直径
+                offset = np.asarray(centers[best], dtype=np.float64) - _H @ self.x
+                if d2[best] < self.gate and np.hypot(*offset) <= MAX_MATCH_DIAMETERS * self._diameter():
+                    matched = candidates[best]
+                    self.update(matched[0], (matched[2], matched[3]))
+                    unmatched = candidates[:best] + candidates[best + 1:]
+
+        chain = self._associate(frame, unmatched) if candidates is not None else None
+        # 当前轨迹在候选链期间有过更新时，候选链只是轨迹之外的误检
+        if chain is not None and (not self.active or self.last_update < chain[0][1]):
+            return self._start(chain), True
+
+        if not self.active:
+            return [], False
+        if frame - self.last_update > self.max_coast_frames:
+            self.reset()
+            return [], False
+
+        return [self._entry(frame, matched[4] if matched is not None else 0.0)], False
+
+    def state_dict(self) -> Dict:
+        """导出可 JSON 序列化的状态（用于检查点）"""
+        chains = [{'entries': [[list(entry[0]), entry[1], entry[2], entry[3], entry[4]]
+                               for entry in chain['entries']],
+                   'misses': chain['misses']}
+                  for chain in self.chains]
+        if not self.active:
+            return {'x': None, 'chains': chains}
+        return {
+            'x': self.x.tolist(),
+            'P': self.P.tolist(),
+            'frame': self.frame,
+            'last_update': self.last_update,
+            'size': list(self.size),
+            'chains': chains
+        }
+
+    def load_state_dict(self, state: Dict):
+        """从 state_dict() 导出的状态恢复"""
+        self.chains = [{'entries': [(tuple(entry[0]), entry[1], entry[2], entry[3], entry[4])
+                                    for entry in chain['entries']],
+                        'misses': chain['misses']}
+                       for chain in state.get('chains', [])]
+        if state.get('x') is None:
+            self.reset()
+            return
+        self.x = np.array(state['x'], dtype=np.float64)
+        self.P = np.array(state['P'], dtype=np.float64)
+        self.frame = state['frame']
+        self.last_update = state['last_update']
+        self.size = tuple(state['size'])
@@ -0,0 +1,320 @@
+# batch_process.py - 批量处理命令行工具
+"""
+批量处理一个目录（或清单文件）中的比赛视频：检测进球并生成集锦
+
+用法:
+    python batch_process.py <目录|清单文件|视频>... [--output-dir outputs/batch] [--workers 2]
+
+清单文件为文本（每行一个视频路径，# 开头为注释）或 JSON 路径列表。
+每个视频在输出目录下生成 <名称>.json 摘要和 <名称>_highlight.mp4 集锦；
+摘要已存在、对应的输入文件未变化且集锦参数相同时跳过该视频（--force 强制重新处理）。
+中途中断的视频下次运行时从检查点继续检测
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv'}
+
+# 工作进程内复用的检测器（每个进程只加载一次模型）
+_detector = None
+# 每个工作进程分到的 CPU 核数，生成集锦时并行剪辑也只使用这些核
+_cpu_share = None
+
+
+def collect_inputs(paths: List[str]) -> List[str]:
+    """展开目录和清单文件，返回去重后的视频路径列表"""
+    videos = []
+    for path in paths:
+        ext = os.path.splitext(path)[1].lower()
+        if os.path.isdir(path):
+            videos += sorted(os.path.join(path, name) for name in os.listdir(path)
+                             if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS)
+        elif ext == '.json':
+            with open(path, 'r', encoding='utf-8') as f:
+                videos += json.load(f)
+        elif ext == '.txt':
+            with open(path, 'r', encoding='utf-8') as f:
+                videos += [line.strip() for line in f
+                           if line.strip() and not line.strip().startswith('#')]
+        else:
+            videos.append(path)
+
+    seen = set()
+    unique = []
+    for video in videos:
+        key = os.path.abspath(video)
+        if key not in seen:
+            seen.add(key)
+            unique.append(video)
+    return unique
+
+
+def output_names(videos: List[str]) -> Dict[str, str]:
+    """每个视频的输出文件名前缀，文件名重复时追加序号"""
+    names = {}
+    used = set()
+    for video in videos:
+        stem = os.path.splitext(os.path.basename(video))[0]
+        name = stem
+        index = 1
+        while name in used:
+            index += 1
+            name = f"{stem}_{index}"
+        used.add(name)
+        names[video] = name
+    return names
+
+
+def source_fingerprint(video_path: str) -> Dict:
+    """输入文件的大小和修改时间，用于判断已处理的结果是否仍然有效"""
+    stat = os.stat(video_path)
+    return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def highlight_options(before: float, after: float, highlight: bool, cut_mode: str,
+                      merge_gap: Optional[float]) -> Dict:
+    """影响片段和集锦的处理参数，记录在摘要中"""
+    return {
+        'before': before,
+        'after': after,
+        'highlight': highlight,
+        'cut_mode': cut_mode,
+        'merge_gap': merge_gap
+    }
+
+
+def is_processed(summary_path: str, video_path: str, options: Dict) -> bool:
+    """摘要存在、处理成功、输入文件未变化，且集锦参数与本次相同、要求的集锦文件仍然存在"""
+    if not os.path.exists(summary_path):
+        return False
+    try:
+        with open(summary_path, 'r', encoding='utf-8') as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if not summary.get('success') or summary.get('source') != source_fingerprint(video_path):
+        return False
+    if summary.get('options') != options:
+        return False
+    if options['highlight']:
+        made = any(shot.get('made') for shot in summary.get('shots', []))
+        if made and not (summary.get('highlight') and os.path.exists(summary['highlight'])):
+            return False
+    return True
+
+
+def _init_worker(detector_kwargs: Dict, num_threads: int):
+    """工作进程初始化：限制线程数并加载检测器"""
+    global _detector, _cpu_share
+    _cpu_share = num_threads
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(1)
+
+    from shot_detector_video import BasketballShotDetector
+    _detector = BasketballShotDetector(**detector_kwargs)
+
+
+def process_video(video_path: str, name: str, output_dir: str, before: float, after: float,
+                  highlight: bool = True, cut_mode: str = 'encode', merge_gap: float = 0.0) -> Dict:
+    """
+    处理单个视频：检测进球、生成集锦、写入摘要
+
+    Returns:
+        摘要字典（同时写入 <output_dir>/<name>.json）
+    """
+    summary = {
+        'video': video_path,
+        'source': source_fingerprint(video_path),
+        'options': highlight_options(before, after, highlight, cut_mode, merge_gap),
+        'success': False,
+        'error': None
+    }
+    start_time = time.time()
+
+    try:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"无法打开视频文件: {video_path}")
+        summary['fps'] = cap.get(cv2.CAP_PROP_FPS)
+        summary['total_frames'] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        # 检查点放在输出目录下，中断后重新运行从上次的位置继续
+        checkpoint_dir = os.path.join(output_dir, '.checkpoints')
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        result = _detector.detect_shots_with_clips(
+            video_path,
+            before_seconds=before,
+            after_seconds=after,
+            checkpoint_path=os.path.join(checkpoint_dir, f"{name}.json"),
+            merge_gap=merge_gap
+        )
+        summary['detection_seconds'] = round(time.time() - start_time, 2)
+        summary['shots'] = result['shots']
+        summary['clips'] = result['clips']
+        summary['stats'] = result['stats']
+
+        summary['highlight'] = None
+        if highlight and result['made_shots']:
+            from video_processor import VideoProcessor
+
+            highlight_path = os.path.join(output_dir, f"{name}_highlight.mp4")
+            processor = VideoProcessor(temp_dir=os.path.join(output_dir, '.temp', name), cpu_count=_cpu_share)
+            video_result = processor.process_video_full_pipeline(
+                video_path=video_path,
+                timestamps=result['made_shots'],
+                output_path=highlight_path,
+                before=before,
+                after=after,
+                mode=cut_mode,
+                merge_gap=merge_gap
+            )
+            if not video_result['success']:
+                raise RuntimeError(video_result['error'])
+            summary['highlight'] = highlight_path
+            summary['segments'] = video_result['segments']
+
+        summary['success'] = True
+    except Exception as e:
+        summary['error'] = str(e)
+
+    summary['elapsed_seconds'] = round(time.time() - start_time, 2)
+    with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def run_batch(videos: List[str], output_dir: str, workers: int = 1, before: float = 8, after: float = 2,
+              force: bool = False, highlight: bool = True, cut_mode: str = 'encode',
+              merge_gap: float = 0.0, **detector_kwargs) -> Dict:
+    """
+    批量处理视频，不同视频在多个工作进程中并行处理
+
+    Returns:
+        汇总信息（同时写入 <output_dir>/batch_summary.json）
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    names = output_names(videos)
+    options = highlight_options(before, after, highlight, cut_mode, merge_gap)
+
+    pending = []
+    skipped = []
+    for video in videos:
+        if not os.path.exists(video):
+            print(f"⚠️  视频不存在，跳过: {video}")
+            continue
+        if not force and is_processed(os.path.join(output_dir, f"{names[video]}.json"), video, options):
+            skipped.append(video)
+            continue
+        pending.append(video)
+
+    print(f"共 {len(videos)} 个视频: 待处理 {len(pending)} 个, 已处理跳过 {len(skipped)} 个, "
+          f"{workers} 个工作进程")
+
+    workers = max(1, min(workers, len(pending) or 1))
+    threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+
+    summaries = []
+    start_time = time.time()
+
+    def report(summary):
+        summaries.append(summary)
+        if summary['success']:
+            stats = summary['stats']
+            fps = summary['total_frames'] / summary['detection_seconds'] if summary['detection_seconds'] else 0
+            print(f"[{len(summaries)}/{len(pending)}] ✓ {summary['video']}: "
+                  f"投篮 {stats['total_attempts']}, 进球 {stats['total_makes']}, "
+                  f"检测 {fps:.1f} 帧/秒, 耗时 {summary['elapsed_seconds']}s")
+        else:
+            print(f"[{len(summaries)}/{len(pending)}] ✗ {summary['video']}: {summary['error']}")
+
+    if workers == 1:
+        if pending:
+            _init_worker(detector_kwargs, threads_per_worker)
+        for video in pending:
+            report(process_video(video, names[video], output_dir, before, after, highlight, cut_mode, merge_gap))
+    else:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(detector_kwargs, threads_per_worker)) as executor:
+            futures = [executor.submit(process_video, video, names[video], output_dir,
+                                       before, after, highlight, cut_mode, merge_gap)
+                       for video in pending]
+            for future in as_completed(futures):
+                report(future.result())
+
+    elapsed = time.time() - start_time
+    succeeded = [s for s in summaries if s['success']]
+    total_frames = sum(s['total_frames'] for s in succeeded)
+
+    batch_summary = {
+        'videos': len(videos),
+        'processed': len(succeeded),
+        'failed': [s['video'] for s in summaries if not s['success']],
+        'skipped': skipped,
+        'total_frames': total_frames,
+        'elapsed_seconds': round(elapsed, 2),
+        'frames_per_second': round(total_frames / elapsed, 2) if elapsed > 0 else 0,
+        'total_attempts': sum(s['stats']['total_attempts'] for s in succeeded),
+        'total_makes': sum(s['stats']['total_makes'] for s in succeeded)
+    }
+    with open(os.path.join(output_dir, 'batch_summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(batch_summary, f, ensure_ascii=False, indent=2)
+
+    print("=" * 60)
+    print(f"完成 {len(succeeded)} 个, 失败 {len(batch_summary['failed'])} 个, 跳过 {len(skipped)} 个")
+    print(f"总帧数 {total_frames}, 总耗时 {elapsed:.1f}s, 吞吐量 {batch_summary['frames_per_second']} 帧/秒")
+    return batch_summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量检测比赛视频中的进球并生成集锦')
+    parser.add_argument('inputs', nargs='+', help='视频目录、清单文件（.txt/.json）或视频文件')
+    parser.add_argument('--output-dir', default=os.path.join('outputs', 'batch'), help='输出目录')
+    parser.add_argument('--workers', type=int, default=1, help='同时处理的视频数（工作进程数）')
+    parser.add_argument('--before', type=float, default=8, help='进球前保留的秒数')
+    parser.add_argument('--after', type=float, default=2, help='进球后保留的秒数')
+    parser.add_argument('--force', action='store_true', help='重新处理已处理过的视频')
+    parser.add_argument('--no-highlight', action='store_true', help='只检测，不生成集锦视频')
+    parser.add_argument('--cut-mode', default='encode', choices=['encode', 'copy', 'smart', 'filtergraph'],
+                        help='集锦生成方式: encode 精确剪辑并重新编码, copy 对齐关键帧直接复制码流, '
+                             'smart 精确剪辑且只编码两端不完整的 GOP, filtergraph 单次解码、单次编码')
+    parser.add_argument('--merge-gap', type=float, default=0.0,
+                        help='间隔不超过该秒数的进球片段合并为一段（重叠的片段总是合并）')
+    parser.add_argument('--no-merge', action='store_true', help='每个进球单独剪辑一段，不合并重叠的片段')
+    parser.add_argument('--model', default='best.pt', help='YOLO模型文件路径')
+    parser.add_argument('--backend', default='torch', help="推理后端: torch/onnx/openvino/onnx-int8")
+    parser.add_argument('--batch-size', type=int, default=1, help='每次推理合并的帧数')
+    parser.add_argument('--pipeline', action='store_true', help='解码与推理流水线并行')
+    parser.add_argument('--roi', action='store_true', help='篮筐区域裁剪推理')
+    parser.add_argument('--sample-interval', type=int, default=1, help='球远离篮筐时的推理间隔帧数')
+    parser.add_argument('--motion-gate', action='store_true', help='篮筐区域静止时跳过推理')
+    parser.add_argument('--kalman', action='store_true', help='卡尔曼滤波跟踪篮球')
+    args = parser.parse_args()
+
+    run_batch(
+        collect_inputs(args.inputs),
+        args.output_dir,
+        workers=args.workers,
+        before=args.before,
+        after=args.after,
+        force=args.force,
+        highlight=not args.no_highlight,
+        cut_mode=args.cut_mode,
+        merge_gap=None if args.no_merge else args.merge_gap,
+        model_path=args.model,
+        backend=args.backend,
+        batch_size=args.batch_size,
+        pipeline=args.pipeline,
+        roi=args.roi,
+        sample_interval=args.sample_interval,
+        motion_gate=args.motion_gate,
+        kalman=args.kalman
+    )
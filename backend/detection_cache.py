@@ -0,0 +1,121 @@
+# detection_cache.py - 检测结果缓存
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+from utils import save_detection_results, load_detection_results, file_content_hash
+
+
+class DetectionCache:
+    """
+    以内容寻址的检测结果缓存
+    
+    键由视频内容哈希、模型权重哈希和检测参数共同决定，同一段比赛重复上传
+    或仅修改 beforeSeconds/afterSeconds 重新处理时可以跳过 YOLO 检测。
+    每个条目保存为一个 JSON 文件，按最近访问时间做 LRU 淘汰，总大小不超过 max_bytes
+    """
+    
+    def __init__(self, cache_dir: str, max_bytes: int = 50 * 1024 * 1024):
+        """
+        初始化缓存
+        
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存文件总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 模型权重哈希按 (路径, 修改时间, 大小) 记忆，避免每个任务重复读取权重
+        self._model_hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def _model_hash(self, model_path: str) -> str:
+        stat = os.stat(model_path)
+        memo_key = (os.path.abspath(model_path), stat.st_mtime, stat.st_size)
+        if memo_key not in self._model_hashes:
+            self._model_hashes[memo_key] = file_content_hash(model_path)
+        return self._model_hashes[memo_key]
+    
+    def make_key(self, video_path: str, model_path: str, settings: Dict) -> str:
+        """
+        生成缓存键
+        
+        Args:
+            video_path: 视频文件路径
+            model_path: 模型权重路径
+            settings: 影响检测结果的参数（见 BasketballShotDetector.cache_signature）
+        """
+        key_source = json.dumps({
+            'video': file_content_hash(video_path),
+            'model': self._model_hash(model_path),
+            'settings': settings
+        }, sort_keys=True)
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+    
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存条目，命中时刷新其访问时间
+        
+        Returns:
+            {'shots': 投篮列表, 'stats': 统计信息}，未命中返回 None
+        """
+        path = self._entry_path(key)
+        with self._lock:
+            if not os.path.exists(path):
+                return None
+            try:
+                entry = load_detection_results(path)
+            except (OSError, ValueError):
+                # 条目损坏，删除后按未命中处理
+                os.remove(path)
+                return None
+            os.utime(path, None)
+        return entry
+    
+    def put(self, key: str, shots, stats: Dict):
+        """写入缓存条目并按需淘汰最久未访问的条目"""
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        entry = {
+            'shots': shots,
+            'stats': stats,
+            'created_at': time.time()
+        }
+        with self._lock:
+            # 先写临时文件再替换，避免并发读取到写了一半的条目
+            save_detection_results(entry, tmp_path)
+            os.replace(tmp_path, path)
+            self._evict()
+    
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        # 按访问时间从旧到新淘汰
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+    
+    def stats(self) -> Dict:
+        """缓存条目数和总大小"""
+        with self._lock:
+            sizes = [
+                os.path.getsize(os.path.join(self.cache_dir, name))
+                for name in os.listdir(self.cache_dir) if name.endswith('.json')
+            ]
+        return {'entries': len(sizes), 'bytes': sum(sizes), 'max_bytes': self.max_bytes}
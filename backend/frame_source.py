@@ -0,0 +1,244 @@
+# frame_source.py - 视频帧来源
+import os
+import subprocess
+import threading
+import time
+import cv2
+import numpy as np
+from typing import Iterator, Tuple
+
+
+class OpenCVFrameSource:
+    """
+    基于 cv2.VideoCapture 的帧来源（原始分辨率）
+
+    帧来源接口：
+        fps, total_frames, width, height: 源视频信息
+        scale: (sx, sy)，输出帧坐标乘以该系数得到源视频坐标
+        frames(start_frame, end_frame): 产出 (帧序号, 帧)
+        release(): 释放资源
+    """
+
+    def __init__(self, video_path: str):
+        self.cap = cv2.VideoCapture(video_path)
+
+        if not self.cap.isOpened():
+            raise ValueError(f"无法打开视频文件: {video_path}")
+
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.scale = (1.0, 1.0)
+
+    def frames(self, start_frame: int = 0, end_frame: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """逐帧读取视频，产出 (帧序号, 帧)，帧序号从 start_frame 开始计数"""
+        if start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+        frame_index = start_frame
+        while end_frame is None or frame_index < end_frame:
+            ret, frame = self.cap.read()
+
+            if not ret:
+                break
+
+            yield frame_index, frame
+            frame_index += 1
+
+    def release(self):
+        self.cap.release()
+
+
+class FFmpegFrameSource:
+    """
+    通过 ffmpeg 管道读取 rawvideo 的帧来源
+
+    由 ffmpeg 完成解码和缩放（可指定解码线程数和输出宽度），
+    输出直接 readinto 到预分配的 NumPy 缓冲区，逐帧读取没有内存分配。
+    缓冲区循环复用：产出的帧在再读取 num_buffers - 1 帧后会被覆盖，
+    调用方需要保证同时持有的帧数少于 num_buffers
+    """
+
+    def __init__(self, video_path: str, width: int = None, pix_fmt: str = 'bgr24',
+                 threads: int = 0, num_buffers: int = 16):
+        """
+        初始化帧来源
+
+        Args:
+            video_path: 视频文件路径
+            width: 输出帧宽度（高度按比例计算），None 或不小于源宽度时保持原始分辨率
+            pix_fmt: 输出像素格式，YOLO 需要 bgr24
+            threads: ffmpeg 解码线程数，0 表示自动
+            num_buffers: 循环使用的帧缓冲区数量
+        """
+        # 用 OpenCV 读取视频信息
+        probe = OpenCVFrameSource(video_path)
+        self.fps = probe.fps
+        self.total_frames = probe.total_frames
+        self.width = probe.width
+        self.height = probe.height
+        probe.release()
+
+        self.video_path = video_path
+        self.pix_fmt = pix_fmt
+        self.threads = threads
+        self.num_buffers = max(2, int(num_buffers))
+
+        # 输出尺寸取偶数，满足 yuv 缩放的要求
+        if width and width < self.width:
+            self.out_width = int(width) // 2 * 2
+            self.out_height = int(round(self.height * self.out_width / self.width / 2)) * 2
+        else:
+            self.out_width = self.width
+            self.out_height = self.height
+        self.scale = (self.width / self.out_width, self.height / self.out_height)
+
+        channels = {'bgr24': 3, 'rgb24': 3, 'gray': 1}
+        if pix_fmt not in channels:
+            raise ValueError(f"不支持的像素格式: {pix_fmt}")
+        self.channels = channels[pix_fmt]
+
+        self._proc = None
+
+    def _command(self, start_frame: int, end_frame: int):
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-threads', str(self.threads)]
+        if start_frame > 0:
+            # -ss 放在 -i 前面：快速定位到关键帧后精确解码到目标时间
+            cmd += ['-ss', f"{start_frame / self.fps:.6f}"]
+        cmd += ['-i', self.video_path]
+        if end_frame is not None:
+            cmd += ['-frames:v', str(max(0, end_frame - start_frame))]
+        if (self.out_width, self.out_height) != (self.width, self.height):
+            cmd += ['-vf', f"scale={self.out_width}:{self.out_height}"]
+        cmd += ['-an', '-f', 'rawvideo', '-pix_fmt', self.pix_fmt, 'pipe:1']
+        return cmd
+
+    def frames(self, start_frame: int = 0, end_frame: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """逐帧读取视频，产出 (帧序号, 帧)，帧序号从 start_frame 开始计数"""
+        shape = (self.out_height, self.out_width, self.channels)
+        frame_size = int(np.prod(shape))
+        buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.num_buffers)]
+        views = [memoryview(buf).cast('B') for buf in buffers]
+
+        self._proc = subprocess.Popen(
+            self._command(start_frame, end_frame),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0
+        )
+        stdout = self._proc.stdout
+
+        try:
+            frame_index = start_frame
+            while True:
+                slot = (frame_index - start_frame) % self.num_buffers
+                view = views[slot]
+
+                # 管道可能分多次返回，读满一帧为止
+                filled = 0
+                while filled < frame_size:
+                    n = stdout.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+
+                if filled < frame_size:
+                    break
+
+                yield frame_index, buffers[slot]
+                frame_index += 1
+        finally:
+            self.release()
+
+    def release(self):
+        if self._proc is not None:
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.stdout.close()
+            self._proc.wait()
+            self._proc = None
+
+
+class LatestFrameReader:
+    """
+    实时流读取：后台线程持续读取，只保留最新的一帧
+
+    处理速度跟不上时，未被取走的旧帧直接被新帧覆盖（计入 dropped），
+    调用方每次拿到的都是最新的帧，延迟不会随时间累积。
+    本地文件按原始帧率回放，作为摄像头/直播流的替身
+    """
+
+    def __init__(self, source, realtime: bool = None):
+        """
+        初始化读取器并启动读取线程
+
+        Args:
+            source: 设备序号、采集 URL（rtsp/http 等）或本地视频文件路径
+            realtime: 是否按原始帧率节流读取，None 表示本地文件节流、设备和 URL 不节流
+        """
+        self.cap = cv2.VideoCapture(source)
+
+        if not self.cap.isOpened():
+            raise ValueError(f"无法打开视频源: {source}")
+
+        # 设备和网络流尽量不在驱动内缓存旧帧
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.realtime = os.path.isfile(str(source)) if realtime is None else realtime
+
+        self.captured = 0
+        self.dropped = 0
+        self._latest = None
+        self._ended = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='live-capture', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.monotonic()
+        frame_index = 0
+        try:
+            while not self._stopped:
+                if self.realtime:
+                    delay = start + frame_index / self.fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                captured_at = time.monotonic()
+
+                with self._cond:
+                    if self._latest is not None:
+                        self.dropped += 1
+                    self._latest = (frame_index, frame, captured_at)
+                    self.captured += 1
+                    self._cond.notify()
+                frame_index += 1
+        finally:
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def read(self, timeout: float = None):
+        """
+        取最新的一帧
+
+        Returns:
+            (帧序号, 帧, 采集时刻 time.monotonic())；流结束或超时返回 None
+        """
+        with self._cond:
+            while self._latest is None and not self._ended:
+                if not self._cond.wait(timeout):
+                    return None
+            item = self._latest
+            self._latest = None
+            return item
+
+    def release(self):
+        self._stopped = True
+        self._thread.join(timeout=2)
+        self.cap.release()
@@ -0,0 +1,167 @@
+# inference_backend.py - 推理后端（PyTorch / ONNX Runtime / OpenVINO）
+import glob
+import json
+import os
+import threading
+from functools import partial
+from ultralytics import YOLO
+from utils import file_content_hash
+from typing import Dict, Optional
+
+# 支持的推理后端：torch 直接运行 .pt 权重；onnx / openvino 先导出再由对应运行时执行；
+# onnx-int8 为 quantize.py 校准生成的 INT8 量化模型，必须先通过精度验证才能使用
+BACKENDS = ('torch', 'onnx', 'openvino', 'onnx-int8')
+
+# 同一进程内（如模型池）多个检测器同时初始化时，只导出一次
+_export_lock = threading.Lock()
+
+
+def exported_model_path(model_path: str, backend: str) -> str:
+    """导出产物的路径（与 ultralytics 的导出命名一致，放在权重文件旁边）"""
+    stem = os.path.splitext(model_path)[0]
+    if backend == 'onnx':
+        return stem + '.onnx'
+    if backend == 'openvino':
+        return stem + '_openvino_model'
+    if backend == 'onnx-int8':
+        return stem + '_int8.onnx'
+    raise ValueError(f"不支持的推理后端: {backend}")
+
+
+def export_model(model_path: str, backend: str, imgsz: int = 640) -> str:
+    """
+    把 .pt 权重导出为指定后端的模型，已有且不旧于权重的导出产物直接复用
+
+    导出为动态输入尺寸，批量推理和篮筐区域裁剪推理（输入尺寸随区域变化）都可以使用
+
+    Returns:
+        导出产物路径
+    """
+    artifact = exported_model_path(model_path, backend)
+    with _export_lock:
+        if os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path):
+            return artifact
+
+        print(f"导出 {backend} 模型: {model_path} -> {artifact}")
+        exported = YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+        return str(exported)
+
+
+def validation_report_path(model_path: str) -> str:
+    """INT8 量化模型精度验证报告的路径"""
+    return os.path.splitext(model_path)[0] + '_int8.validation.json'
+
+
+def check_int8_validation(model_path: str) -> Dict:
+    """
+    确认 INT8 量化模型已通过精度验证（quantize.py validate）
+
+    Raises:
+        RuntimeError: 没有验证报告、验证未通过，或量化模型在验证后被替换
+    """
+    artifact = exported_model_path(model_path, 'onnx-int8')
+    if not os.path.exists(artifact):
+        raise RuntimeError(f"INT8 模型不存在: {artifact}，请先运行 python quantize.py calibrate")
+
+    report_path = validation_report_path(model_path)
+    if not os.path.exists(report_path):
+        raise RuntimeError("INT8 模型尚未验证，请先运行 python quantize.py validate")
+
+    with open(report_path, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+
+    if report.get('sha256') != file_content_hash(artifact):
+        raise RuntimeError("INT8 模型在验证后被修改，请重新运行 python quantize.py validate")
+    if not report.get('passed'):
+        raise RuntimeError(f"INT8 模型未通过精度验证: 投篮一致率 {report.get('agreement')}, "
+                           f"丢失进球 {report.get('lost_makes')} 个")
+    return report
+
+
+def _tune_runtime(predictor, artifact: str, num_threads: int):
+    """
+    按固定配置重建 ONNX Runtime 会话 / OpenVINO 编译模型（on_predict_start 回调）
+
+    ultralytics 在首次推理时才创建运行时，且不接受会话参数，默认配置下每个会话都会占满
+    所有物理核：分片/批处理工作进程和模型池中的多个检测器同时推理时线程严重超额。
+    这里改为：
+    - ONNX Runtime：算子内 num_threads 个线程、算子间串行（检测模型是单条链路，
+      inter-op 并行没有收益），开启全部图优化（含 INT8 模型的 QDQ 融合）
+    - OpenVINO：LATENCY 模式（逐次同步推理，单个推理流）、推理线程数 num_threads
+    """
+    backend = predictor.model
+    # 新版 ultralytics 把各格式的运行时放在 AutoBackend.backend 上
+    backend = getattr(backend, 'backend', backend)
+    if getattr(backend, '_runtime_tuned', False):
+        return
+
+    if getattr(backend, 'session', None) is not None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = backend.session
+        backend.session = ort.InferenceSession(artifact, options, providers=session.get_providers(),
+                                               provider_options=[session.get_provider_options()[name]
+                                                                 for name in session.get_providers()])
+    elif getattr(backend, 'ov_compiled_model', None) is not None:
+        import openvino as ov
+
+        xml_path = artifact if artifact.endswith('.xml') else glob.glob(os.path.join(artifact, '*.xml'))[0]
+        core = ov.Core()
+        backend.ov_compiled_model = core.compile_model(core.read_model(xml_path), 'CPU', {
+            'PERFORMANCE_HINT': 'LATENCY',
+            'NUM_STREAMS': 1,
+            'INFERENCE_NUM_THREADS': num_threads
+        })
+        if hasattr(backend, 'inference_mode'):
+            backend.inference_mode = 'LATENCY'
+
+    backend._runtime_tuned = True
+
+
+def load_model(model_path: str, backend: str = 'torch', require_validation: bool = True,
+               num_threads: Optional[int] = None):
+    """
+    按后端加载检测模型
+
+    各后端返回的都是 ultralytics YOLO 对象，调用方式和结果格式（r.boxes）完全相同
+
+    Args:
+        model_path: .pt 权重路径
+        backend: 'torch'、'onnx'、'openvino' 或 'onnx-int8'
+        require_validation: onnx-int8 是否要求已通过精度验证（只有验证命令自身会关闭）
+        num_threads: ONNX Runtime / OpenVINO 的推理线程数，None 表示与 torch.get_num_threads() 一致
+            （分片和批处理工作进程在创建检测器前已按进程数设置了 torch 线程数）
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}")
+
+    if backend == 'torch':
+        return YOLO(model_path)
+
+    if backend == 'onnx-int8':
+        if require_validation:
+            check_int8_validation(model_path)
+        artifact = exported_model_path(model_path, backend)
+    else:
+        artifact = export_model(model_path, backend)
+
+    if num_threads is None:
+        import torch
+        num_threads = torch.get_num_threads()
+
+    model = YOLO(artifact, task='detect')
+    model.add_callback('on_predict_start', partial(_tune_runtime, artifact=artifact,
+                                                   num_threads=max(1, int(num_threads))))
+    return model
+
+
+def backend_device(backend: str, device: str) -> str:
+    """推理设备：OpenVINO 和 INT8 量化模型只在 CPU 上运行，其余后端沿用 get_device() 的结果"""
+    if backend in ('openvino', 'onnx-int8'):
+        return 'cpu'
+    return device
@@ -0,0 +1,89 @@
+# model_pool.py - 检测模型池
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from shot_detector_video import BasketballShotDetector
+
+
+class ModelPool:
+    """
+    进程内共享的检测器池
+    
+    服务启动时预先加载并预热固定数量的检测器，任务通过 checkout() 借出、
+    用完自动归还，避免每个任务重复加载权重，也限制了同时驻留内存的模型数量
+    """
+    
+    def __init__(self, model_path='best.pt', size=1, warmup=True, **detector_kwargs):
+        """
+        初始化模型池
+        
+        Args:
+            model_path: YOLO模型文件路径
+            size: 池中检测器数量（即最多同时运行的检测任务数）
+            warmup: 是否在加载后执行一次预热推理
+            **detector_kwargs: 传给 BasketballShotDetector 的其他参数
+        """
+        self.model_path = model_path
+        self.size = max(1, int(size))
+        self._available = queue.Queue()
+        # 池内检测器参数相同，检测结果缓存的键可直接使用这份参数
+        self.signature = None
+        
+        # 池内检测器在不同线程中同时推理：onnx/openvino 后端按检测器数平分CPU线程
+        detector_kwargs.setdefault('num_threads', max(1, (os.cpu_count() or 1) // self.size))
+        
+        start_time = time.time()
+        for i in range(self.size):
+            detector = BasketballShotDetector(model_path=model_path, **detector_kwargs)
+            if warmup:
+                detector.warmup()
+            self._available.put(detector)
+            self.signature = detector.cache_signature()
+            print(f"模型池: 已加载 {i + 1}/{self.size} 个检测器")
+        
+        print(f"模型池就绪，耗时 {time.time() - start_time:.2f}s")
+    
+    @contextmanager
+    def checkout(self, timeout=None):
+        """
+        借出一个检测器，离开 with 块时自动归还
+        
+        Args:
+            timeout: 等待空闲检测器的最长秒数，None 表示一直等待
+        
+        Raises:
+            TimeoutError: 超时仍没有空闲检测器
+        """
+        try:
+            detector = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"等待空闲检测模型超时 ({timeout}s)")
+        
+        try:
+            yield detector
+        finally:
+            self._available.put(detector)
+    
+    def available(self) -> int:
+        """当前空闲的检测器数量"""
+        return self._available.qsize()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_model_pool(model_path='best.pt', size=1, **detector_kwargs) -> ModelPool:
+    """创建全局模型池（重复调用返回已创建的实例）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ModelPool(model_path=model_path, size=size, **detector_kwargs)
+        return _pool
+
+
+def get_model_pool() -> ModelPool:
+    """获取全局模型池，未初始化时返回 None"""
+    return _pool
@@ -0,0 +1,138 @@
+# overlay_renderer.py - 叠加层绘制
+import cv2
+import numpy as np
+from typing import Dict, Tuple
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class _TextLayer:
+    """
+    预先渲染好的文字图块
+
+    每一笔存为 (1 - 覆盖率, 颜色 * 覆盖率) 两个浮点图块（putText 的笔画边缘带抗锯齿），
+    绘制时在 scratch 中依次混合：scratch = scratch * (1 - 覆盖率) + 颜色 * 覆盖率
+    """
+    __slots__ = ('strokes', 'scratch', 'dx', 'dy')
+
+    def __init__(self, strokes, scratch, dx, dy):
+        self.strokes = strokes
+        self.scratch = scratch
+        self.dx = dx
+        self.dy = dy
+
+
+class OverlayRenderer:
+    """
+    逐帧叠加层绘制，不分配整帧大小的缓冲区
+
+    - 文字（比分、投篮结果）按内容缓存为小图块，每帧只在文字所在区域就地混合
+    - 颜色渐隐用按帧尺寸和颜色预分配的纯色缓冲区，在原帧上就地混合，可限定混合区域
+    """
+
+    def __init__(self, max_text_layers: int = 64):
+        self.max_text_layers = max_text_layers
+        self._text_layers: Dict[tuple, _TextLayer] = {}
+        self._color_buffers: Dict[tuple, np.ndarray] = {}
+
+    @staticmethod
+    def text_size(text: str, font_scale: float, thickness: int) -> Tuple[int, int]:
+        """文字宽高（与 cv2.getTextSize 相同）"""
+        (width, height), _ = cv2.getTextSize(text, FONT, font_scale, thickness)
+        return width, height
+
+    def _text_layer(self, text, font_scale, strokes) -> _TextLayer:
+        key = (text, font_scale, strokes)
+        layer = self._text_layers.get(key)
+        if layer is not None:
+            return layer
+
+        # getTextSize 不含笔画粗细，'/' 等字符还会高出字高，先在留足余量的画布上渲染，
+        # 再裁到实际有笔画的范围；原点在画布内的 (pad, pad + 文字高度)
+        max_thickness = max(thickness for _, thickness in strokes)
+        (width, height), baseline = cv2.getTextSize(text, FONT, font_scale, max_thickness)
+        pad = max_thickness + height // 2 + 2
+        shape = (height + baseline + 2 * pad, width + 2 * pad)
+        origin = (pad, pad + height)
+
+        masks = []
+        for _, thickness in strokes:
+            mask = np.zeros(shape, dtype=np.uint8)
+            cv2.putText(mask, text, origin, FONT, font_scale, 255, thickness)
+            masks.append(mask)
+
+        ys, xs = np.nonzero(np.max(masks, axis=0))
+        y1, y2, x1, x2 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+
+        blended = []
+        for (color, _), mask in zip(strokes, masks):
+            coverage = mask[y1:y2, x1:x2, np.newaxis].astype(np.float32) / 255
+            blended.append((1 - coverage, coverage * np.array(color, dtype=np.float32)))
+
+        scratch = np.empty((y2 - y1, x2 - x1, 3), dtype=np.float32)
+        layer = _TextLayer(blended, scratch, int(x1) - origin[0], int(y1) - origin[1])
+        if len(self._text_layers) >= self.max_text_layers:
+            self._text_layers.clear()
+        self._text_layers[key] = layer
+        return layer
+
+    def draw_text(self, frame: np.ndarray, text: str, org: Tuple[int, int], font_scale: float, strokes):
+        """
+        在帧上就地绘制文字，效果与依次调用 cv2.putText 相同（抗锯齿边缘的取整误差不超过 1）
+
+        Args:
+            frame: 目标帧
+            text: 文字
+            org: 文字左下角（与 cv2.putText 相同）
+            font_scale: 字号
+            strokes: 依次绘制的笔画 ((颜色, 粗细), ...)，如先粗白再细黑得到描边效果
+        """
+        if not text:
+            return
+        strokes = tuple((tuple(color), thickness) for color, thickness in strokes)
+        layer = self._text_layer(text, font_scale, strokes)
+
+        x1, y1 = org[0] + layer.dx, org[1] + layer.dy
+        height, width = layer.scratch.shape[:2]
+
+        # 裁掉超出帧的部分
+        fx1, fy1 = max(0, x1), max(0, y1)
+        fx2, fy2 = min(frame.shape[1], x1 + width), min(frame.shape[0], y1 + height)
+        if fx2 <= fx1 or fy2 <= fy1:
+            return
+
+        px1, py1 = fx1 - x1, fy1 - y1
+        px2, py2 = px1 + (fx2 - fx1), py1 + (fy2 - fy1)
+        region = frame[fy1:fy2, fx1:fx2]
+        scratch = layer.scratch[py1:py2, px1:px2]
+
+        np.copyto(scratch, region)
+        for keep, paint in layer.strokes:
+            np.multiply(scratch, keep[py1:py2, px1:px2], out=scratch)
+            np.add(scratch, paint[py1:py2, px1:px2], out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(region, scratch, casting='unsafe')
+
+    def tint(self, frame: np.ndarray, color, alpha: float, rect=None):
+        """
+        就地把帧（或 rect 区域）与纯色按 alpha 混合：frame = frame * (1 - alpha) + color * alpha
+
+        Args:
+            rect: (x1, y1, x2, y2)，None 表示整帧
+        """
+        key = (frame.shape, tuple(color))
+        buffer = self._color_buffers.get(key)
+        if buffer is None:
+            if len(self._color_buffers) >= 8:
+                self._color_buffers.clear()
+            buffer = np.empty(frame.shape, dtype=frame.dtype)
+            buffer[:] = color
+            self._color_buffers[key] = buffer
+
+        if rect is None:
+            cv2.addWeighted(frame, 1 - alpha, buffer, alpha, 0, dst=frame)
+            return
+
+        x1, y1, x2, y2 = rect
+        region = frame[y1:y2, x1:x2]
+        cv2.addWeighted(region, 1 - alpha, buffer[y1:y2, x1:x2], alpha, 0, dst=region)
@@ -0,0 +1,261 @@
+# quantize.py - INT8 量化模型的校准与精度验证
+"""
+INT8 量化模型的校准与精度验证
+
+用法:
+    python quantize.py calibrate <视频|目录|清单文件>... [--model best.pt] [--frames 300]
+    python quantize.py validate <视频|目录|清单文件>... [--model best.pt] [--min-agreement 0.95] [--max-lost-makes 0]
+
+calibrate 从用户视频中均匀抽帧，用 ONNX Runtime 静态量化生成 best_int8.onnx；
+validate 在一组视频上对比量化模型与浮点模型的投篮数、进球数以及 up_frame/down_frame，
+结果写入 best_int8.validation.json。只有验证通过（且量化模型未被替换）时，
+BasketballShotDetector(backend='onnx-int8') 才能加载量化模型
+"""
+import argparse
+import json
+import math
+import os
+import time
+import cv2
+import numpy as np
+from inference_backend import (
+    export_model, exported_model_path, load_model, validation_report_path
+)
+from utils import file_content_hash
+from batch_process import collect_inputs
+from shot_detector_video import BasketballShotDetector
+from typing import Dict, List
+
+def sample_frames(video_paths: List[str], num_frames: int) -> List[np.ndarray]:
+    """从每个视频中均匀抽取帧，总数约为 num_frames"""
+    per_video = max(1, math.ceil(num_frames / max(1, len(video_paths))))
+    frames = []
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for position in np.linspace(0, max(0, total - 1), per_video).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(position))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+    return frames[:num_frames]
+
+
+def letterbox(frame: np.ndarray, imgsz: int = 640) -> np.ndarray:
+    """与 ultralytics 推理相同的预处理：等比缩放、灰边填充、BGR 转 RGB、归一化，输出 NCHW"""
+    height, width = frame.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+
+    image = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return image[np.newaxis]
+
+
+def head_postprocess_nodes(onnx_path: str) -> List[str]:
+    """
+    检测头中解码框坐标的节点（DFL、拼接、sigmoid 等），保持浮点精度
+
+    这些节点的数值范围很大，量化后框坐标误差明显；卷积部分照常量化
+    """
+    import onnx
+
+    names = [node.name for node in onnx.load(onnx_path).graph.node]
+    indices = []
+    for name in names:
+        parts = name.split('/')
+        if len(parts) > 1 and parts[1].startswith('model.'):
+            try:
+                indices.append(int(parts[1].split('.')[1]))
+            except ValueError:
+                pass
+    if not indices:
+        return []
+
+    head = f"/model.{max(indices)}/"
+    return [name for name in names
+            if name.startswith(head) and '/cv2.' not in name and '/cv3.' not in name]
+
+
+def calibrate(model_path: str, videos: List[str], num_frames: int = 300, imgsz: int = 640) -> str:
+    """
+    用用户视频中的帧校准并生成 INT8 量化模型
+
+    Returns:
+        量化模型路径
+    """
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    frames = sample_frames(videos, num_frames)
+    if not frames:
+        raise ValueError("没有可用于校准的视频帧")
+    print(f"校准帧: {len(frames)} 帧，来自 {len(videos)} 个视频")
+
+    float_path = export_model(model_path, 'onnx', imgsz)
+    prep_path = os.path.splitext(float_path)[0] + '_prep.onnx'
+    int8_path = exported_model_path(model_path, 'onnx-int8')
+    quant_pre_process(float_path, prep_path)
+
+    session = onnxruntime.InferenceSession(prep_path, providers=['CPUExecutionProvider'])
+    input_name = session.get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            return None if frame is None else {input_name: letterbox(frame, imgsz)}
+
+    try:
+        quantize_static(
+            prep_path, int8_path, FrameReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            nodes_to_exclude=head_postprocess_nodes(prep_path)
+        )
+    finally:
+        os.remove(prep_path)
+
+    # 旧的验证报告对应旧的量化模型，不再有效
+    report_path = validation_report_path(model_path)
+    if os.path.exists(report_path):
+        os.remove(report_path)
+
+    print(f"INT8 模型已生成: {int8_path}（使用前请运行 validate）")
+    return int8_path
+
+
+def compare_shots(reference: List[Dict], quantized: List[Dict], frame_tolerance: int) -> Dict:
+    """
+    按进球帧配对两组投篮，统计一致情况
+
+    一次投篮一致：双方都检测到（down_frame 相差不超过 frame_tolerance），
+    进球判定相同，且 up_frame 相差不超过 frame_tolerance
+    """
+    pairs = []
+    used = set()
+    for shot in reference:
+        best = None
+        for j, other in enumerate(quantized):
+            diff = abs(other['frame'] - shot['frame'])
+            if j not in used and diff <= frame_tolerance and (best is None or diff < best[1]):
+                best = (j, diff)
+        if best is not None:
+            used.add(best[0])
+            pairs.append((shot, quantized[best[0]]))
+
+    agreeing = sum(1 for shot, other in pairs
+                   if shot['made'] == other['made'] and
+                   abs(shot['up_frame'] - other['up_frame']) <= frame_tolerance)
+    kept_makes = sum(1 for shot, other in pairs if shot['made'] and other['made'])
+    reference_makes = sum(1 for shot in reference if shot['made'])
+
+    return {
+        'reference_shots': len(reference),
+        'quantized_shots': len(quantized),
+        'reference_makes': reference_makes,
+        'quantized_makes': sum(1 for shot in quantized if shot['made']),
+        'agreeing_shots': agreeing,
+        'total_shots': max(len(reference), len(quantized)),
+        'lost_makes': reference_makes - kept_makes,
+        'max_down_frame_diff': max((abs(s['frame'] - o['frame']) for s, o in pairs), default=0),
+        'max_up_frame_diff': max((abs(s['up_frame'] - o['up_frame']) for s, o in pairs), default=0)
+    }
+
+
+def validate(model_path: str, videos: List[str], min_agreement: float = 0.95, max_lost_makes: int = 0,
+             frame_tolerance: int = 3, reference_backend: str = 'torch') -> Dict:
+    """
+    对比量化模型和浮点模型的投篮检测结果，写入验证报告
+
+    投篮一致率不低于 min_agreement 且丢失的进球不超过 max_lost_makes 才算通过
+
+    Returns:
+        验证报告
+    """
+    int8_path = exported_model_path(model_path, 'onnx-int8')
+    if not os.path.exists(int8_path):
+        raise FileNotFoundError(f"INT8 模型不存在: {int8_path}，请先运行 calibrate")
+
+    reference = BasketballShotDetector(model_path=model_path, backend=reference_backend)
+    quantized = BasketballShotDetector(model_path=model_path, backend='onnx')
+    quantized.model = load_model(model_path, 'onnx-int8', require_validation=False)
+    quantized.device = 'cpu'
+
+    per_video = {}
+    elapsed = {'reference': 0.0, 'quantized': 0.0}
+    for video_path in videos:
+        print(f"\n验证视频: {video_path}")
+        start_time = time.time()
+        reference_shots = reference.detect_shots(video_path)
+        elapsed['reference'] += time.time() - start_time
+
+        start_time = time.time()
+        quantized_shots = quantized.detect_shots(video_path)
+        elapsed['quantized'] += time.time() - start_time
+
+        per_video[video_path] = compare_shots(reference_shots, quantized_shots, frame_tolerance)
+
+    total = sum(stats['total_shots'] for stats in per_video.values())
+    agreeing = sum(stats['agreeing_shots'] for stats in per_video.values())
+    lost_makes = sum(stats['lost_makes'] for stats in per_video.values())
+    agreement = round(agreeing / total, 4) if total else 1.0
+
+    report = {
+        'model': int8_path,
+        'sha256': file_content_hash(int8_path),
+        'reference_backend': reference_backend,
+        'agreement': agreement,
+        'lost_makes': lost_makes,
+        'min_agreement': min_agreement,
+        'max_lost_makes': max_lost_makes,
+        'frame_tolerance': frame_tolerance,
+        'speedup': round(elapsed['reference'] / elapsed['quantized'], 2) if elapsed['quantized'] else None,
+        'passed': agreement >= min_agreement and lost_makes <= max_lost_makes,
+        'videos': per_video
+    }
+
+    with open(validation_report_path(model_path), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n投篮一致率: {agreement * 100:.1f}% (要求 ≥ {min_agreement * 100:.1f}%), "
+          f"丢失进球: {lost_makes} 个 (允许 {max_lost_makes} 个), 加速 {report['speedup']}x")
+    print("✅ 验证通过，可以使用 backend='onnx-int8'" if report['passed']
+          else "❌ 验证未通过，量化模型不会被启用")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='INT8 量化模型的校准与精度验证')
+    parser.add_argument('command', choices=['calibrate', 'validate'])
+    parser.add_argument('videos', nargs='+', help='视频文件、目录或清单文件（.txt/.json）')
+    parser.add_argument('--model', default='best.pt', help='浮点权重路径')
+    parser.add_argument('--frames', type=int, default=300, help='校准帧数')
+    parser.add_argument('--imgsz', type=int, default=640, help='校准输入尺寸')
+    parser.add_argument('--min-agreement', type=float, default=0.95, help='最低投篮一致率')
+    parser.add_argument('--max-lost-makes', type=int, default=0, help='允许丢失的进球数')
+    parser.add_argument('--frame-tolerance', type=int, default=3, help='up_frame/down_frame 允许的帧差')
+    parser.add_argument('--reference', default='torch', choices=['torch', 'onnx', 'openvino'],
+                        help='作为基准的浮点模型后端')
+    args = parser.parse_args()
+
+    video_paths = [path for path in collect_inputs(args.videos) if os.path.exists(path)]
+    if not video_paths:
+        parser.error("没有找到视频文件")
+
+    if args.command == 'calibrate':
+        calibrate(args.model, video_paths, args.frames, args.imgsz)
+    else:
+        result = validate(args.model, video_paths, args.min_agreement, args.max_lost_makes,
+                          args.frame_tolerance, args.reference)
+        raise SystemExit(0 if result['passed'] else 1)
@@ -1,171 +1,306 @@
 # Avi Shah - Basketball Shot Detector/Tracker - July 2023
 
 from ultralytics import YOLO
+import argparse
 import cv2
 import cvzone
-import math
+import time
 import numpy as np
-from utils import score, detect_down, detect_up, in_hoop_region, clean_hoop_pos, clean_ball_pos, get_device
+from collections import deque
+from utils import get_device, boxes_to_array, StageTimer
+from shot_tracker import ShotTracker
+from frame_source import LatestFrameReader
+from overlay_renderer import OverlayRenderer
+
+# Change these to your relative paths
+DEFAULT_MODEL_PATH = "D:/basketball-highlight-generator/backend/best.pt"
+DEFAULT_VIDEO_PATH = "D:/basketball-highlight-generator/backend/test_fils/video_test_2.mp4"
+
+# Number of recent shot events kept in ShotDetector.events (live sessions can run indefinitely)
+MAX_EVENTS = 1000
 
 
 class ShotDetector:
-    def __init__(self):
-        # Load the YOLO model created from main.py - change text to your relative path
+    def __init__(self, source=DEFAULT_VIDEO_PATH, model_path=DEFAULT_MODEL_PATH,
+                 live=False, headless=False, on_shot=None, output_path=None, run=True):
+        """
+        Args:
+            source: video file path, capture device index (e.g. 0 for a webcam) or capture URL (rtsp/http)
+            model_path: YOLO weights
+            live: live mode - capture runs in its own thread and only the freshest frame is processed,
+                stale frames are dropped under load. Local files are replayed at native fps
+            headless: no GUI window. Frames are only annotated when output_path is set
+            on_shot: callback(event) called for every shot in both file and live mode, see emit_shot
+            output_path: write the annotated frames to this video file (.mp4 uses mp4v, other extensions MJPG)
+            run: start processing right away
+        """
+        # Load the YOLO model created from main.py
         self.overlay_text = "Waiting..."
-        self.model = YOLO("D:/basketball-highlight-generator/backend/best.pt")
-        
+        self.model = YOLO(model_path)
+
         # Uncomment this line to accelerate inference. Note that this may cause errors in some setups.
         #self.model.half()
-        
+
         self.class_names = ['Basketball', 'Basketball Hoop']
         self.device = get_device()
-        # Uncomment line below to use webcam (I streamed to my iPhone using Iriun Webcam)
-        # self.cap = cv2.VideoCapture(0)
 
-        # Use video - replace text with your video path
-        self.cap = cv2.VideoCapture("D:/basketball-highlight-generator/backend/test_fils/video_test_2.mp4")
+        # Device indices may come in as strings from the command line
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        self.source = source
+        self.live = live
+        self.headless = headless
+        self.on_shot = on_shot
+        self.output_path = output_path
+        self.draw = not headless or output_path is not None
+        self.writer = None
 
-        self.ball_pos = []  # array of tuples ((x_pos, y_pos), frame count, width, height, conf)
-        self.hoop_pos = []  # array of tuples ((x_pos, y_pos), frame count, width, height, conf)
+        # Text layers and the fade color buffer are reused across frames
+        self.renderer = OverlayRenderer()
+
+        # Ball/hoop tracks, up/down state and make/attempt counts (shared with BasketballShotDetector)
+        self.tracker = ShotTracker(ball_conf=.3, hoop_conf=.5)
 
         self.frame_count = 0
         self.frame = None
 
-        self.makes = 0
-        self.attempts = 0
-
-        # Used to detect shots (upper and lower region)
-        self.up = False
-        self.down = False
-        self.up_frame = 0
-        self.down_frame = 0
-
         # Used for green and red colors after make/miss
         self.fade_frames = 20
         self.fade_counter = 0
         self.overlay_color = (0, 0, 0)
 
-        self.run()
+        # The most recent MAX_EVENTS shot events and the total number of shots emitted
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.shot_count = 0
+
+        # Live mode: capture-to-processing latency of every processed frame, kept in a fixed histogram
+        self.latency_timer = StageTimer(('latency',))
+        self.live_stats = None
+
+        if run:
+            self.run()
 
     def run(self):
+        if self.live:
+            self.run_live()
+            return
+
+        self.cap = cv2.VideoCapture(self.source)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+
         while True:
             ret, self.frame = self.cap.read()
+            captured_at = time.monotonic()
 
             if not ret:
                 # End of the video or an error occurred
                 break
 
-            results = self.model(self.frame, stream=True, device=self.device)
-
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    # Bounding box
-                    x1, y1, x2, y2 = box.xyxy[0]
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    w, h = x2 - x1, y2 - y1
-
-                    # Confidence
-                    conf = math.ceil((box.conf[0] * 100)) / 100
-
-                    # Class Name
-                    cls = int(box.cls[0])
-                    current_class = self.class_names[cls]
-
-                    center = (int(x1 + w / 2), int(y1 + h / 2))
-
-                    # Only create ball points if high confidence or near hoop
-                    if (conf > .3 or (in_hoop_region(center, self.hoop_pos) and conf > 0.15)) and current_class == "Basketball":
-                        self.ball_pos.append((center, self.frame_count, w, h, conf))
-                        cvzone.cornerRect(self.frame, (x1, y1, w, h))
-
-                    # Create hoop points if high confidence
-                    if conf > .5 and current_class == "Basketball Hoop":
-                        self.hoop_pos.append((center, self.frame_count, w, h, conf))
-                        cvzone.cornerRect(self.frame, (x1, y1, w, h))
-
-            self.clean_motion()
-            self.shot_detection()
-            self.display_score()
+            shot = self.process_frame()
+            self.emit_shot(shot, fps, captured_at)
             self.frame_count += 1
+            self.write_frame(fps)
 
-            cv2.imshow('Frame', self.frame)
-
-            # Close if 'q' is clicked
-            if cv2.waitKey(1) & 0xFF == ord('q'):  # higher waitKey slows video down, use 1 for webcam
+            if not self.show_frame():
                 break
 
         self.cap.release()
-        cv2.destroyAllWindows()
+        self.release_writer()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def run_live(self):
+        reader = LatestFrameReader(self.source)
+        fps = reader.fps
+        last_index = -1
+
+        try:
+            while True:
+                item = reader.read()
+                if item is None:
+                    # Stream ended
+                    break
+                frame_index, frame, captured_at = item
+
+                # Dropped frames count as frames without detections so the tracker still advances
+                # frame by frame (check_shot only decides every 10th frame). The recording repeats
+                # the last rendered frame for each of them so it keeps the source timing
+                for skipped in range(last_index + 1, frame_index):
+                    self.tracker.add_detections(None, skipped)
+                    self.tracker.clean(skipped)
+                    self.emit_shot(self.tracker.check_shot(skipped), fps, captured_at)
+                    if self.frame is not None:
+                        self.write_frame(fps)
+                last_index = frame_index
+
+                self.frame = frame
+                self.frame_count = frame_index
+                shot = self.process_frame()
+                self.emit_shot(shot, fps, captured_at)
+                self.latency_timer.record('latency', time.monotonic() - captured_at)
+                self.write_frame(fps)
+
+                if not self.show_frame():
+                    break
+        finally:
+            reader.release()
+            self.release_writer()
+            if not self.headless:
+                cv2.destroyAllWindows()
+
+        latency = self.latency_timer.summary()['stages']['latency']
+        self.live_stats = {
+            'captured_frames': reader.captured,
+            'processed_frames': latency['frames'],
+            'dropped_frames': reader.dropped,
+            'latency_p50_ms': round(latency['p50_ms'], 1),
+            'latency_p95_ms': round(latency['p95_ms'], 1),
+            'shots': self.shot_count
+        }
+        print(f"Live: captured {reader.captured}, processed {latency['frames']}, "
+              f"dropped {reader.dropped}, latency p50 {self.live_stats['latency_p50_ms']}ms "
+              f"p95 {self.live_stats['latency_p95_ms']}ms")
+
+    def process_frame(self):
+        """Detect, track and draw one frame. Returns the shot event dict from ShotTracker.check_shot or None"""
+        results = self.model(self.frame, stream=True, device=self.device, verbose=False)
+
+        for r in results:
+            # Pull all boxes to NumPy once and filter them as arrays
+            det = boxes_to_array(r.boxes)
+
+            # Only create ball points if high confidence or near hoop; hoop points if high confidence
+            ball_idx, hoop_idx = self.tracker.add_detections(det, self.frame_count)
+
+            if self.draw:
+                for x1, y1, x2, y2 in det[np.concatenate((ball_idx, hoop_idx)), 0:4].astype(int).tolist():
+                    cvzone.cornerRect(self.frame, (x1, y1, x2 - x1, y2 - y1))
+
+        self.clean_motion()
+        shot = self.shot_detection()
+        if self.draw:
+            self.display_score()
+        return shot
+
+    def show_frame(self):
+        """Show the current frame unless headless. Returns False when 'q' is pressed"""
+        if self.headless:
+            return True
+
+        cv2.imshow('Frame', self.frame)
+
+        # Close if 'q' is clicked
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))  # higher waitKey slows video down, use 1 for webcam
+
+    def write_frame(self, fps):
+        """Append the annotated frame to output_path (the writer is opened on the first frame)"""
+        if self.output_path is None:
+            return
+
+        if self.writer is None:
+            fourcc = 'mp4v' if self.output_path.lower().endswith('.mp4') else 'MJPG'
+            height, width = self.frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.output_path, cv2.VideoWriter_fourcc(*fourcc),
+                                          fps or 30, (width, height))
+        self.writer.write(self.frame)
+
+    def release_writer(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def emit_shot(self, shot, fps, captured_at):
+        """
+        Record a shot event and pass it to on_shot.
+
+        The event carries latency_ms: time from capturing (or, for files, reading) the newest frame
+        used for the decision to emitting the event
+        """
+        if shot is None:
+            return
+
+        event = {
+            'frame': shot['frame'],
+            'up_frame': shot['up_frame'],
+            'timestamp': round(shot['frame'] / fps, 2),
+            'made': shot['made'],
+            'latency_ms': round((time.monotonic() - captured_at) * 1000, 1)
+        }
+        self.events.append(event)
+        self.shot_count += 1
+        print(f"Shot #{self.shot_count} - frame {event['frame']}, {'make' if event['made'] else 'miss'}, "
+              f"latency {event['latency_ms']}ms")
+        if self.on_shot:
+            self.on_shot(event)
 
     def clean_motion(self):
-        # Clean and display ball motion
-        self.ball_pos = clean_ball_pos(self.ball_pos, self.frame_count)
-        for i in range(0, len(self.ball_pos)):
-            cv2.circle(self.frame, self.ball_pos[i][0], 2, (0, 0, 255), 2)
+        # Clean ball and hoop motion
+        hoop_tracked = len(self.tracker.hoop_pos) > 1
+        self.tracker.clean(self.frame_count)
 
-        # Clean hoop motion and display current hoop center
-        if len(self.hoop_pos) > 1:
-            self.hoop_pos = clean_hoop_pos(self.hoop_pos)
-            cv2.circle(self.frame, self.hoop_pos[-1][0], 2, (128, 128, 0), 2)
+        if not self.draw:
+            return
+
+        # Display ball motion
+        for i in range(0, len(self.tracker.ball_pos)):
+            cv2.circle(self.frame, self.tracker.ball_pos[i][0], 2, (0, 0, 255), 2)
+
+        # Display current hoop center
+        if hoop_tracked:
+            cv2.circle(self.frame, self.tracker.hoop_pos[-1][0], 2, (128, 128, 0), 2)
 
     def shot_detection(self):
-        if len(self.hoop_pos) > 0 and len(self.ball_pos) > 0:
-            # Detecting when ball is in 'up' and 'down' area - ball can only be in 'down' area after it is in 'up'
-            if not self.up:
-                self.up = detect_up(self.ball_pos, self.hoop_pos)
-                if self.up:
-                    self.up_frame = self.ball_pos[-1][1]
-
-            if self.up and not self.down:
-                self.down = detect_down(self.ball_pos, self.hoop_pos)
-                if self.down:
-                    self.down_frame = self.ball_pos[-1][1]
-
-            # If ball goes from 'up' area to 'down' area in that order, increase attempt and reset
-            if self.frame_count % 10 == 0:
-                if self.up and self.down and self.up_frame < self.down_frame:
-                    self.attempts += 1
-                    self.up = False
-                    self.down = False
-
-                    # If it is a make, put a green overlay and display "完美"
-                    if score(self.ball_pos, self.hoop_pos):
-                        self.makes += 1
-                        self.overlay_color = (0, 255, 0)  # Green for make
-                        self.overlay_text = "Make"
-                        self.fade_counter = self.fade_frames
-
-                    else:
-                        self.overlay_color = (255, 0, 0)  # Red for miss
-                        self.overlay_text = "Miss"
-                        self.fade_counter = self.fade_frames
+        # Ball must go from 'up' area to 'down' area in that order to count as an attempt
+        shot = self.tracker.check_shot(self.frame_count)
+        if shot is None:
+            return None
+
+        # If it is a make, put a green overlay and display "完美"
+        if shot['made']:
+            self.overlay_color = (0, 255, 0)  # Green for make
+            self.overlay_text = "Make"
+            self.fade_counter = self.fade_frames
+
+        else:
+            self.overlay_color = (255, 0, 0)  # Red for miss
+            self.overlay_text = "Miss"
+            self.fade_counter = self.fade_frames
+
+        return shot
 
     def display_score(self):
-        # Add text
-        text = str(self.makes) + " / " + str(self.attempts)
-        cv2.putText(self.frame, text, (50, 125), cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
-        cv2.putText(self.frame, text, (50, 125), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 3)
+        # Add text (thick white stroke under a thin black one)
+        text = str(self.tracker.makes) + " / " + str(self.tracker.attempts)
+        self.renderer.draw_text(self.frame, text, (50, 125), 3, (((255, 255, 255), 6), ((0, 0, 0), 3)))
 
         # Add overlay text for shot result if it exists
         if hasattr(self, 'overlay_text'):
             # Calculate text size to position it at the right top corner
-            (text_width, text_height), _ = cv2.getTextSize(self.overlay_text, cv2.FONT_HERSHEY_SIMPLEX, 3, 6)
+            text_width, text_height = self.renderer.text_size(self.overlay_text, 3, 6)
             text_x = self.frame.shape[1] - text_width - 40  # Right alignment with some margin
             text_y = 100  # Top margin
 
             # Display overlay text with color (overlay_color)
-            cv2.putText(self.frame, self.overlay_text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 3,
-                        self.overlay_color, 6)
-            # cv2.putText(self.frame, self.overlay_text, (text_x, text_y), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 0), 3)
+            self.renderer.draw_text(self.frame, self.overlay_text, (text_x, text_y), 3,
+                                    ((self.overlay_color, 6),))
 
-        # Gradually fade out color after shot
+        # Gradually fade out color after shot, blended into the frame in place
         if self.fade_counter > 0:
             alpha = 0.2 * (self.fade_counter / self.fade_frames)
-            self.frame = cv2.addWeighted(self.frame, 1 - alpha, np.full_like(self.frame, self.overlay_color), alpha, 0)
+            self.renderer.tint(self.frame, self.overlay_color, alpha)
             self.fade_counter -= 1
 
 
 if __name__ == "__main__":
-    ShotDetector()
-
+    parser = argparse.ArgumentParser(description='Basketball shot detector')
+    parser.add_argument('source', nargs='?', default=DEFAULT_VIDEO_PATH,
+                        help='video file, capture device index or capture URL')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help='YOLO weights')
+    parser.add_argument('--live', action='store_true',
+                        help='process only the freshest frame and drop stale ones (files replay at native fps)')
+    parser.add_argument('--headless', action='store_true', help='no GUI window')
+    parser.add_argument('--output', default=None, help='write the annotated video to this file')
+    args = parser.parse_args()
+
+    ShotDetector(source=args.source, model_path=args.model, live=args.live, headless=args.headless,
+                 output_path=args.output)
@@ -1,180 +1,889 @@
 # basketball_shot_detector.py - 批量进球检测模块
-from ultralytics import YOLO
 import cv2
 import math
 import numpy as np
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from utils import (
-    score, detect_down, detect_up, in_hoop_region, 
-    clean_hoop_pos, clean_ball_pos, get_device
+    detect_up, in_hoop_region, get_device, boxes_to_array, StageTimer,
+    save_detection_results, load_detection_results, shot_windows
 )
-from typing import List, Dict
+from shot_tracker import ShotTracker
+from frame_source import OpenCVFrameSource, FFmpegFrameSource
+from inference_backend import load_model, backend_device
+from typing import List, Dict, Iterator
+
+# 运动检测中任一通道差值超过该值的像素视为发生了变化（滤掉压缩噪声和轻微的亮度波动）
+MOTION_PIXEL_DELTA = 20
+
+
+class _QueueStage:
+    """
+    流水线阶段：在后台线程中消费上游迭代器，通过有界队列把结果交给下游
+    
+    下游每取一次元素记录一次队列深度，用于判断瓶颈所在：
+    队列长期接近满说明下游更慢，长期接近空说明本阶段更慢
+    """
+    _DONE = object()
+    
+    def __init__(self, source, maxsize, name):
+        self.name = name
+        self.maxsize = maxsize
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._error = None
+        self._depth_sum = 0
+        self._depth_max = 0
+        self._samples = 0
+        self._thread = threading.Thread(target=self._run, args=(source,), name=name, daemon=True)
+        self._thread.start()
+    
+    def _put(self, item):
+        # 带超时地等待队列空位，以便 close() 能让生产线程及时退出
+        while not self._stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _run(self, source):
+        try:
+            for item in source:
+                if not self._put(item):
+                    return
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(self._DONE)
+    
+    def __iter__(self):
+        while True:
+            depth = self.queue.qsize()
+            self._depth_sum += depth
+            self._depth_max = max(self._depth_max, depth)
+            self._samples += 1
+            
+            item = self.queue.get()
+            if item is self._DONE:
+                break
+            yield item
+        
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+    
+    def close(self):
+        """通知生产线程退出并等待其结束"""
+        self._stop.set()
+        self._thread.join()
+    
+    def stats(self) -> Dict:
+        """队列深度统计"""
+        return {
+            'capacity': self.maxsize,
+            'avg_depth': round(self._depth_sum / self._samples, 2) if self._samples else 0,
+            'max_depth': self._depth_max
+        }
+
 
 class BasketballShotDetector:
     """
     批量处理篮球视频，检测所有进球时刻
     """
-    def __init__(self, model_path='best.pt', confidence_threshold=0.25):
+    def __init__(self, model_path='best.pt', confidence_threshold=0.25, batch_size=1,
+                 pipeline=False, queue_size=8,
+                 roi=False, roi_margin=5, roi_lock_frames=10, roi_refresh_interval=150,
+                 sample_interval=1, dense_hold_frames=30,
+                 num_workers=1, shard_overlap_seconds=10,
+                 checkpoint_interval=3000,
+                 frame_source='opencv', inference_width=None, decoder_threads=0,
+                 motion_gate=False, motion_threshold=0.001, motion_width=320, motion_max_skip=30,
+                 kalman=False, backend='torch', num_threads=None):
         """
         初始化检测器
         
         Args:
             model_path: YOLO模型文件路径
             confidence_threshold: 检测置信度阈值
+            batch_size: 每次推理合并的帧数，1 表示逐帧推理
+            pipeline: 是否启用流水线模式（解码、推理、追踪分线程并行）
+            queue_size: 流水线模式下各阶段之间队列的容量（帧数）
+            roi: 是否启用篮筐区域裁剪推理（篮筐位置稳定后只检测篮筐附近区域）
+            roi_margin: 裁剪区域向篮筐四周扩展的篮筐尺寸倍数
+            roi_lock_frames: 篮筐位置需要连续保持的检测次数，达到后才锁定区域
+            roi_refresh_interval: 锁定期间每隔多少帧做一次全帧检测以重新确认篮筐
+            sample_interval: 球不在篮筐附近时每隔多少帧推理一次，1 表示逐帧推理
+            dense_hold_frames: 球离开篮筐区域后继续逐帧推理的帧数
+            num_workers: 分片检测的工作进程数，大于 1 时按时间切分视频并行检测
+            shard_overlap_seconds: 相邻分片重叠的秒数，用于预热篮筐状态和衔接跨分片的投篮
+            checkpoint_interval: 指定检查点文件时，每处理多少帧保存一次检查点
+            frame_source: 帧来源，'opencv'（cv2.VideoCapture）或 'ffmpeg'（rawvideo 管道）
+            inference_width: ffmpeg 帧来源的输出宽度，解码时直接缩放到该宽度，None 表示原始分辨率
+            decoder_threads: ffmpeg 解码线程数，0 表示自动
+            motion_gate: 是否启用运动门控（篮筐区域与上一推理帧相比没有变化时跳过推理）
+            motion_threshold: 篮筐区域内变化像素占比不超过该值时视为静止
+            motion_width: 运动检测时把帧缩小到的宽度
+            motion_max_skip: 连续跳过的最大帧数，达到后强制推理一次以刷新篮筐位置
+            kalman: 是否用卡尔曼滤波跟踪篮球：连续几帧一致的检测框才开始轨迹，过滤孤立误检；
+                在跳过或漏检的帧上用预测位置补齐轨迹（预测位置不参与投篮判定）
+            backend: 推理后端，'torch'、'onnx'、'openvino' 或 'onnx-int8'；onnx/openvino 首次使用时把权重导出到同一目录并复用，
+                onnx-int8 需要先用 quantize.py 校准并通过精度验证
+            num_threads: onnx/openvino 后端的推理线程数，None 表示与 torch.get_num_threads() 一致；
+                分片工作进程按进程数重新分配，不沿用该值
         """
-        self.model = YOLO(model_path)
+        # 工作进程用相同参数重建检测器
+        self._shard_kwargs = {
+            'model_path': model_path,
+            'confidence_threshold': confidence_threshold,
+            'batch_size': batch_size,
+            'pipeline': pipeline,
+            'queue_size': queue_size,
+            'roi': roi,
+            'roi_margin': roi_margin,
+            'roi_lock_frames': roi_lock_frames,
+            'roi_refresh_interval': roi_refresh_interval,
+            'sample_interval': sample_interval,
+            'dense_hold_frames': dense_hold_frames,
+            'frame_source': frame_source,
+            'inference_width': inference_width,
+            'decoder_threads': decoder_threads,
+            'motion_gate': motion_gate,
+            'motion_threshold': motion_threshold,
+            'motion_width': motion_width,
+            'motion_max_skip': motion_max_skip,
+            'kalman': kalman,
+            'backend': backend
+        }
+        
+        self.backend = backend
+        self.model = load_model(model_path, backend, num_threads=num_threads)
         self.class_names = ['Basketball', 'Basketball Hoop']
-        self.device = get_device()
+        self.device = backend_device(backend, get_device())
         self.confidence_threshold = confidence_threshold
+        self.batch_size = max(1, int(batch_size))
+        self.pipeline = pipeline
+        self.queue_size = max(1, int(queue_size))
+        self.last_pipeline_stats = None
+        self.roi = roi
+        self.roi_margin = roi_margin
+        self.roi_lock_frames = max(1, int(roi_lock_frames))
+        self.roi_refresh_interval = max(1, int(roi_refresh_interval))
+        self.last_roi_stats = None
+        self._reset_roi()
+        self.sample_interval = max(1, int(sample_interval))
+        self.dense_hold_frames = max(1, int(dense_hold_frames))
+        self.last_sampling_stats = None
+        self._reset_sampling()
+        self.num_workers = max(1, int(num_workers))
+        self.shard_overlap_seconds = shard_overlap_seconds
+        self.checkpoint_interval = max(1, int(checkpoint_interval))
+        if frame_source not in ('opencv', 'ffmpeg'):
+            raise ValueError(f"不支持的帧来源: {frame_source}")
+        self.frame_source = frame_source
+        self.inference_width = inference_width
+        self.decoder_threads = decoder_threads
+        # 当前帧来源的坐标缩放系数 (sx, sy)：推理帧坐标乘以该系数得到原始视频坐标
+        self._frame_scale = (1.0, 1.0)
+        self.motion_gate = motion_gate
+        self.motion_threshold = motion_threshold
+        self.motion_width = max(16, int(motion_width))
+        self.motion_max_skip = max(1, int(motion_max_skip))
+        self.last_motion_stats = None
+        self._reset_motion()
+        self.kalman = kalman
+        self.last_timing = None
+        self._reset_timing()
         
         print(f"使用设备: {self.device}")
-        print(f"模型加载完成: {model_path}")
+        print(f"模型加载完成: {model_path} (推理后端: {self.backend})")
+        if self.batch_size > 1:
+            print(f"批量推理: 每批 {self.batch_size} 帧")
+        if self.pipeline:
+            print(f"流水线模式: 队列容量 {self.queue_size}")
+        if self.roi:
+            print(f"篮筐区域推理: 扩展 {self.roi_margin} 倍篮筐尺寸, "
+                  f"每 {self.roi_refresh_interval} 帧全帧检测一次")
+        if self.sample_interval > 1:
+            print(f"自适应采样: 球远离篮筐时每 {self.sample_interval} 帧推理一次")
+        if self.num_workers > 1:
+            print(f"分片检测: {self.num_workers} 个工作进程, 分片重叠 {self.shard_overlap_seconds}s")
+        if self.frame_source == 'ffmpeg':
+            print(f"FFmpeg 解码: 输出宽度 {self.inference_width or '原始'}, 解码线程 {self.decoder_threads or '自动'}")
+        if self.motion_gate:
+            print(f"运动门控: 变化像素占比阈值 {self.motion_threshold}, 最多连续跳过 {self.motion_max_skip} 帧")
+        if self.kalman:
+            print("篮球跟踪: 卡尔曼滤波")
+    
+    def _open_source(self, video_path):
+        """按配置创建帧来源"""
+        if self.frame_source == 'ffmpeg':
+            # 同时被持有的帧：解码队列 + 推理批次 + 自适应采样暂存帧 + 各线程手上的帧
+            num_buffers = self.queue_size + self.batch_size + self.sample_interval + 4
+            return FFmpegFrameSource(
+                video_path,
+                width=self.inference_width,
+                threads=self.decoder_threads,
+                num_buffers=num_buffers
+            )
+        return OpenCVFrameSource(video_path)
+    
+    def cache_signature(self) -> Dict:
+        """影响检测结果的参数，用于生成检测结果缓存的键"""
+        # 批量推理和流水线只影响速度，不影响结果
+        signature = {
+            key: value for key, value in self._shard_kwargs.items()
+            if key not in ('model_path', 'batch_size', 'pipeline', 'queue_size', 'decoder_threads')
+        }
+        signature['num_workers'] = self.num_workers
+        signature['shard_overlap_seconds'] = self.shard_overlap_seconds
+        return signature
+    
+    def warmup(self, imgsz=640):
+        """
+        用空白图像执行一次推理，提前完成模型融合和显存/内存分配，
+        避免首个任务承担冷启动开销
+        
+        Args:
+            imgsz: 预热图像边长
+        """
+        blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+        for _ in self.model(blank, stream=True, device=self.device, verbose=False):
+            pass
+    
+    def _reset_roi(self):
+        """重置篮筐区域锁定状态（每个视频开始时调用）"""
+        # 锁定的篮筐位置 ((x, y), frame, w, h, conf)，由追踪阶段写入、推理阶段读取
+        self._roi_hoop = None
+        self._roi_last_full_frame = None
+        self._inferred_pixels = 0
+        self._full_pixels = 0
+        self._roi_frames = 0
+    
+    def _update_roi_lock(self, hoop_pos, frame_count):
+        """
+        根据清理后的篮筐轨迹更新区域锁定
+        
+        篮筐位置稳定保持 roi_lock_frames 次检测后锁定；
+        超过 roi_refresh_interval 帧未再检测到篮筐则解锁，回到全帧检测
+        """
+        if not self.roi:
+            return
+        
+        if (len(hoop_pos) >= self.roi_lock_frames and
+                frame_count - hoop_pos[-1][1] < self.roi_refresh_interval):
+            self._roi_hoop = hoop_pos[-1]
+        else:
+            self._roi_hoop = None
+    
+    def _reset_sampling(self):
+        """重置自适应采样状态（每个视频开始时调用）"""
+        # 在此帧序号之前保持逐帧推理，由追踪阶段和推理阶段共同推后
+        self._dense_until = -1
+        # 最近的篮筐位置，供推理阶段判断采样帧中的球是否靠近篮筐
+        self._sample_hoop = None
+        self._skipped_frames = 0
+        self._backfilled_frames = 0
+    
+    @staticmethod
+    def _in_shot_zone(center, hoop_pos):
+        """球心是否位于 in_hoop_region 或 detect_up 区域内"""
+        return in_hoop_region(center, hoop_pos) or detect_up([(center,)], hoop_pos)
+    
+    def _update_sampling(self, ball_pos, hoop_pos, frame_count):
+        """追踪阶段：球出现在篮筐附近时切换为逐帧推理"""
+        if self.sample_interval <= 1:
+            return
+        
+        self._sample_hoop = hoop_pos[-1] if hoop_pos else None
+        if (ball_pos and hoop_pos and ball_pos[-1][1] == frame_count and
+                self._in_shot_zone(ball_pos[-1][0], hoop_pos)):
+            self._dense_until = max(self._dense_until, frame_count + self.dense_hold_frames)
+    
+    def _ball_near_hoop(self, detections):
+        """推理阶段：采样帧的检测结果中是否有球靠近篮筐"""
+        hoop = self._sample_hoop
+        if hoop is None:
+            return False
+        
+        for _, det in detections:
+            if det is None:
+                continue
+            balls = det[(det[:, 5] == 0) & (det[:, 4] > 0.15)]
+            centers = ((balls[:, 0:2] + balls[:, 2:4]) / 2).astype(np.int64)
+            for center in centers.tolist():
+                if self._in_shot_zone(center, [hoop]):
+                    return True
+        return False
+    
+    def _reset_timing(self):
+        """重置分阶段计时（每个视频开始时调用）"""
+        self._timer = StageTimer(('decode', 'inference', 'postprocess', 'track', 'shot_logic'))
+        self._tracked_frames = 0
+    
+    def timing_summary(self) -> Dict:
+        """
+        当前视频的分阶段计时汇总（检测进行中也可调用）
+        
+        阶段: decode 解码, motion_gate 运动门控, inference 推理（含裁剪预处理）,
+        postprocess 检测框转换, track 检测框筛选和轨迹清理, shot_logic 投篮判定。
+        格式见 utils.StageTimer.summary
+        """
+        return self._timer.summary(frames=self._tracked_frames)
+    
+    def _timed_frames(self, frames):
+        """逐帧计时解码耗时"""
+        timer = self._timer
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(frames, None)
+                if item is None:
+                    return
+                timer.record('decode', time.perf_counter() - start)
+                yield item
+        finally:
+            frames.close()
+    
+    def _reset_motion(self):
+        """重置运动门控状态（每个视频开始时调用）"""
+        # 最近的篮筐位置，由追踪阶段写入、推理阶段读取，用于限定运动检测区域
+        self._motion_hoop = None
+        # 上一个通过门控的帧（缩小后的图像）及其帧序号
+        self._motion_ref = None
+        self._motion_ref_index = None
+        self._motion_checked_frames = 0
+        self._motion_skipped_frames = 0
+    
+    def _update_motion_zone(self, hoop_pos):
+        """追踪阶段：更新运动检测区域对应的篮筐位置"""
+        if self.motion_gate:
+            self._motion_hoop = hoop_pos[-1] if hoop_pos else None
+    
+    def _motion_zone(self, small_shape, frame_shape):
+        """
+        计算缩小后的图像中的运动检测区域
+        
+        Returns:
+            (x1, y1, x2, y2)；尚未检测到篮筐时返回 None，表示检测整帧
+        """
+        hoop = self._motion_hoop
+        if hoop is None:
+            return None
+        
+        # 篮筐位置为原始视频坐标，先换算到推理帧坐标，再换算到缩小后的坐标
+        (cx, cy), _, w, h, _ = hoop
+        kx = small_shape[1] / frame_shape[1] / self._frame_scale[0]
+        ky = small_shape[0] / frame_shape[0] / self._frame_scale[1]
+        
+        # 与裁剪推理相同的范围，覆盖 detect_up 和 detect_down 区域
+        x1 = max(0, int((cx - self.roi_margin * w) * kx))
+        x2 = min(small_shape[1], int((cx + self.roi_margin * w) * kx) + 1)
+        y1 = max(0, int((cy - self.roi_margin * h) * ky))
+        y2 = min(small_shape[0], int((cy + self.roi_margin * h) * ky) + 1)
+        
+        if x2 <= x1 or y2 <= y1:
+            return None
+        
+        return x1, y1, x2, y2
+    
+    def _motion_filter(self, item):
+        """
+        推理阶段：篮筐区域与上一个通过门控的帧相比没有变化时，把帧替换为 None（跳过推理）
+        
+        与上一推理帧而不是上一帧比较，缓慢的运动累积起来同样会触发推理
+        """
+        frame_index, frame = item
+        if not self.motion_gate or frame is None:
+            return item
+        
+        self._motion_checked_frames += 1
+        start = time.perf_counter()
+        try:
+            return self._motion_check(frame_index, frame, item)
+        finally:
+            self._timer.record('motion_gate', time.perf_counter() - start)
+    
+    def _motion_check(self, frame_index, frame, item):
+        height, width = frame.shape[:2]
+        small_width = min(width, self.motion_width)
+        small_height = max(1, int(round(height * small_width / width)))
+        small = cv2.resize(frame, (small_width, small_height), interpolation=cv2.INTER_AREA)
+        
+        ref = self._motion_ref
+        if (ref is not None and ref.shape == small.shape and
+                frame_index - self._motion_ref_index < self.motion_max_skip):
+            # 取各通道差值的最大值：橙色的球和木地板亮度接近，只看灰度容易漏检
+            # （cv2.max 逐通道合并比 ndarray.max(axis=2) 快一个数量级）
+            diff = cv2.absdiff(small, ref)
+            if diff.ndim == 3:
+                channels = cv2.split(diff)
+                diff = channels[0]
+                for channel in channels[1:]:
+                    diff = cv2.max(diff, channel)
+            zone = self._motion_zone(small.shape, frame.shape)
+            if zone is not None:
+                x1, y1, x2, y2 = zone
+                diff = diff[y1:y2, x1:x2]
+            
+            if np.count_nonzero(diff > MOTION_PIXEL_DELTA) <= self.motion_threshold * diff.size:
+                self._motion_skipped_frames += 1
+                return frame_index, None
+        
+        self._motion_ref = small
+        self._motion_ref_index = frame_index
+        return item
+    
+    def _roi_rect(self, frame_index, frame_shape):
+        """
+        计算当前帧的裁剪区域
+        
+        Returns:
+            (x1, y1, x2, y2) 裁剪区域；返回 None 表示需要全帧检测
+        """
+        hoop = self._roi_hoop
+        if not self.roi or hoop is None:
+            self._roi_last_full_frame = frame_index
+            return None
+        
+        # 定期全帧检测，防止机位变化后丢失篮筐
+        if (self._roi_last_full_frame is None or
+                frame_index - self._roi_last_full_frame >= self.roi_refresh_interval):
+            self._roi_last_full_frame = frame_index
+            return None
+        
+        # 篮筐位置为原始视频坐标，换算到推理帧坐标
+        (cx, cy), _, w, h, _ = hoop
+        sx, sy = self._frame_scale
+        cx, w = cx / sx, w / sx
+        cy, h = cy / sy, h / sy
+        height, width = frame_shape[:2]
+        
+        # 覆盖 detect_up 的上方区域（4倍宽、2倍高）以及下方 detect_down 区域
+        x1 = max(0, int(cx - self.roi_margin * w))
+        x2 = min(width, int(cx + self.roi_margin * w))
+        y1 = max(0, int(cy - self.roi_margin * h))
+        y2 = min(height, int(cy + self.roi_margin * h))
+        
+        if x2 - x1 < 32 or y2 - y1 < 32:
+            return None
+        
+        return x1, y1, x2, y2
+    
+    def _infer_batch(self, batch):
+        """
+        对一批帧运行YOLO检测
+        
+        Args:
+            batch: [(帧序号, 帧), ...]，帧为 None 表示被运动门控跳过
+        
+        Returns:
+            按帧顺序排列的 [(帧序号, 检测框数组), ...]，
+            检测框数组格式见 utils.boxes_to_array，坐标已映射回原始视频分辨率；
+            被跳过的帧检测结果为 None
+        """
+        live = [item for item in batch if item[1] is not None]
+        if len(live) < len(batch):
+            detections = dict(self._infer_batch(live)) if live else {}
+            return [(frame_index, detections.get(frame_index)) for frame_index, _ in batch]
+        
+        start = time.perf_counter()
+        
+        # 同一批帧共用一个裁剪区域，保证批内图像尺寸一致
+        frame_shape = batch[0][1].shape
+        rect = self._roi_rect(batch[0][0], frame_shape)
+        
+        kwargs = {}
+        offset = (0, 0)
+        if rect is None:
+            frames = [frame for _, frame in batch]
+            self._inferred_pixels += frame_shape[0] * frame_shape[1] * len(batch)
+            self._full_pixels += frame_shape[0] * frame_shape[1] * len(batch)
+        else:
+            x1, y1, x2, y2 = rect
+            frames = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for _, frame in batch]
+            offset = (x1, y1)
+            self._roi_frames += len(batch)
+            self._inferred_pixels += (x2 - x1) * (y2 - y1) * len(batch)
+            self._full_pixels += frame_shape[0] * frame_shape[1] * len(batch)
+            # 裁剪区域较小时不放大到默认输入尺寸，直接按32对齐的原始尺寸推理
+            kwargs['imgsz'] = min(640, int(math.ceil(max(x2 - x1, y2 - y1) / 32)) * 32)
+        
+        if len(batch) == 1:
+            results = list(self.model(frames[0], stream=True, device=self.device, verbose=False, **kwargs))
+        else:
+            # 多帧合并为一次调用，分摊预处理、调度和后处理开销
+            results = self.model(frames, device=self.device, verbose=False, **kwargs)
+        inferred = time.perf_counter()
+        self._timer.record('inference', inferred - start, len(batch))
+        
+        detections = [(frame_index, boxes_to_array(r.boxes, offset, self._frame_scale))
+                      for (frame_index, _), r in zip(batch, results)]
+        self._timer.record('postprocess', time.perf_counter() - inferred, len(batch))
+        return detections
+    
+    def _infer_backfill(self, pending):
+        """按批推理稀疏模式下暂存的帧"""
+        self._backfilled_frames += len(pending)
+        for i in range(0, len(pending), self.batch_size):
+            yield from self._infer_batch(pending[i:i + self.batch_size])
+    
+    def _iter_detections(self, frames):
+        """
+        按帧顺序产出 (帧序号, 检测框数组)
+        
+        batch_size > 1 时攒够一批帧再推理，视频末尾不足一批的帧单独成批。
+        
+        sample_interval > 1 时，球远离篮筐期间只推理每第 k 帧，其余帧暂存；
+        若采样帧发现球进入篮筐附近，先回填推理暂存的帧再切换到逐帧推理，
+        保证 up_frame/down_frame 精确到帧。未推理的帧以检测结果 None 产出，
+        使追踪阶段仍然逐帧推进
+        
+        motion_gate 启用时，篮筐区域静止的帧先被替换为 None，不参与推理，
+        追踪状态原样保留到下一个推理帧
+        """
+        batch = []
+        pending = []
+        for item in frames:
+            item = self._motion_filter(item)
+            frame_index = item[0]
+            
+            if self.sample_interval > 1 and frame_index > self._dense_until:
+                # 稀疏模式
+                if batch:
+                    yield from self._infer_batch(batch)
+                    batch = []
+                
+                if frame_index % self.sample_interval != 0:
+                    pending.append(item)
+                    continue
+                
+                sampled = self._infer_batch([item])
+                if self._ball_near_hoop(sampled):
+                    self._dense_until = frame_index + self.dense_hold_frames
+                    yield from self._infer_backfill(pending)
+                else:
+                    self._skipped_frames += len(pending)
+                    for skipped_index, _ in pending:
+                        yield skipped_index, None
+                pending = []
+                yield from sampled
+                continue
+            
+            # 追踪阶段已切换到逐帧推理，回填尚未推理的暂存帧
+            if pending:
+                yield from self._infer_backfill(pending)
+                pending = []
+            
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield from self._infer_batch(batch)
+                batch = []
+        
+        if batch:
+            yield from self._infer_batch(batch)
+        
+        self._skipped_frames += len(pending)
+        for skipped_index, _ in pending:
+            yield skipped_index, None
+    
+    def _iter_pipeline(self, source, start_frame=0, end_frame=None):
+        """
+        产出 (帧序号, 检测框数组)，供追踪阶段按帧顺序消费
+        
+        流水线模式下解码和推理各占一个线程，通过有界队列衔接，
+        吞吐量接近 max(解码, 推理) 而不是两者之和
+        """
+        frames = self._timed_frames(source.frames(start_frame, end_frame))
+        if not self.pipeline:
+            yield from self._iter_detections(frames)
+            return
+        
+        decode_stage = _QueueStage(frames, self.queue_size, 'decode')
+        infer_stage = _QueueStage(self._iter_detections(decode_stage), self.queue_size, 'inference')
+        try:
+            yield from infer_stage
+        finally:
+            infer_stage.close()
+            decode_stage.close()
+            
+            self.last_pipeline_stats = {
+                'decode_queue': decode_stage.stats(),
+                'inference_queue': infer_stage.stats()
+            }
+            print("流水线队列深度:")
+            for name, stats in self.last_pipeline_stats.items():
+                print(f"  {name}: 平均 {stats['avg_depth']}/{stats['capacity']}, "
+                      f"峰值 {stats['max_depth']}")
+    
+    def _save_checkpoint(self, checkpoint_path, next_frame, end_frame, tracker, shots):
+        """保存检查点（先写临时文件再替换，进程中途被杀也不会留下损坏的检查点）"""
+        checkpoint = {
+            'signature': self.cache_signature(),
+            'end_frame': end_frame,
+            'next_frame': next_frame,
+            'tracker': tracker.state_dict(),
+            'shots': shots
+        }
+        tmp_path = f"{checkpoint_path}.tmp"
+        save_detection_results(checkpoint, tmp_path)
+        os.replace(tmp_path, checkpoint_path)
+    
+    def _load_checkpoint(self, checkpoint_path, end_frame):
+        """读取检查点；不存在、损坏或与当前参数不匹配时返回 None"""
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return None
+        
+        try:
+            checkpoint = load_detection_results(checkpoint_path)
+        except (OSError, ValueError) as e:
+            print(f"检查点读取失败，从头开始检测: {e}")
+            return None
+        
+        if (checkpoint.get('signature') != self.cache_signature() or
+                checkpoint.get('end_frame') != end_frame):
+            print("检查点与当前检测参数不匹配，从头开始检测")
+            return None
+        
+        return checkpoint
+    
+    def iter_shots(self, video_path: str, progress_callback=None,
+                   start_frame: int = 0, end_frame: int = None,
+                   checkpoint_path: str = None) -> Iterator[Dict]:
+        """
+        逐个产出视频中的投篮，每次投篮判定完成后立即产出，无需等待整段视频处理完
+        
+        Args:
+            video_path: 视频文件路径
+            progress_callback: 进度回调函数 callback(current_frame, total_frames)
+            start_frame: 起始帧（包含），帧数和时间戳仍按整段视频计算
+            end_frame: 结束帧（不包含），None 表示到视频末尾
+            checkpoint_path: 检查点文件路径。指定时每 checkpoint_interval 帧保存一次检测状态；
+                若文件已存在则先产出其中已检测到的投篮，再从记录的帧继续检测。
+                检测正常结束后删除检查点
+        
+        Yields:
+            {'frame': 进球帧（球落到篮筐下方）, 'up_frame': 球到达篮筐上方的帧, 'timestamp': 时间戳（秒）, 'made': True/False (是否进球)}
+        """
+        source = self._open_source(video_path)
+        
+        # 获取视频信息
+        fps = source.fps
+        total_frames = source.total_frames
+        self._frame_scale = source.scale
+        
+        print(f"视频信息 - FPS: {fps}, 总帧数: {total_frames}")
+        
+        tracker = ShotTracker(ball_conf=self.confidence_threshold, hoop_conf=0.3, kalman=self.kalman)
+        self._reset_roi()
+        self._reset_sampling()
+        self._reset_motion()
+        self._reset_timing()
+        timer = self._timer
+        
+        # 从检查点恢复：追踪状态、已检测到的投篮和下一帧位置
+        shots = []
+        checkpoint = self._load_checkpoint(checkpoint_path, end_frame)
+        if checkpoint:
+            tracker.load_state_dict(checkpoint['tracker'])
+            shots = checkpoint['shots']
+            start_frame = checkpoint['next_frame']
+            print(f"从检查点恢复: 第 {start_frame} 帧, 已检测到 {len(shots)} 次投篮")
+            yield from list(shots)
+        
+        detections = self._iter_pipeline(source, start_frame, end_frame)
+        try:
+            for frame_count, det in detections:
+                # 加入检测框并清理位置数据
+                start = time.perf_counter()
+                tracker.add_detections(det, frame_count)
+                tracker.clean(frame_count)
+                tracked = time.perf_counter()
+                timer.record('track', tracked - start)
+                
+                self._update_roi_lock(tracker.hoop_pos, frame_count)
+                self._update_motion_zone(tracker.hoop_pos)
+                
+                # 投篮检测逻辑
+                event = tracker.check_shot(frame_count)
+                if event:
+                    down_frame = event['frame']
+                    is_made = event['made']
+                    
+                    print(f"检测到投篮 #{tracker.attempts} - "
+                          f"帧: {down_frame}, "
+                          f"时间: {down_frame/fps:.2f}s, "
+                          f"{'进球' if is_made else '未进'}")
+                    
+                    shot = {
+                        'frame': down_frame,
+                        'up_frame': event['up_frame'],
+                        'timestamp': round(down_frame / fps, 2),
+                        'made': is_made
+                    }
+                    shots.append(shot)
+                    yield shot
+                
+                self._update_sampling(tracker.ball_pos, tracker.hoop_pos, frame_count)
+                timer.record('shot_logic', time.perf_counter() - tracked)
+                self._tracked_frames += 1
+                
+                # 进度回调
+                if progress_callback and (frame_count + 1) % 30 == 0:
+                    progress_callback(frame_count + 1, total_frames)
+                
+                # 定期保存检查点，下次从下一帧继续
+                if checkpoint_path and (frame_count + 1) % self.checkpoint_interval == 0:
+                    self._save_checkpoint(checkpoint_path, frame_count + 1, end_frame, tracker, shots)
+        finally:
+            detections.close()
+            source.release()
+        
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        
+        self.last_timing = self.timing_summary()
+        print(f"分阶段耗时 ({self.last_timing['fps']} 帧/秒, 瓶颈: {self.last_timing['bottleneck']}):")
+        for stage, stats in self.last_timing['stages'].items():
+            print(f"  {stage}: 共 {stats['total_seconds']}s, 每帧 p50 {stats['p50_ms']}ms, p95 {stats['p95_ms']}ms")
+        
+        if self.roi:
+            self.last_roi_stats = {
+                'roi_frames': self._roi_frames,
+                'pixel_ratio': round(self._inferred_pixels / self._full_pixels, 4) if self._full_pixels else 0
+            }
+            print(f"篮筐区域推理: {self._roi_frames} 帧使用裁剪区域, "
+                  f"推理像素为全帧的 {self.last_roi_stats['pixel_ratio'] * 100:.1f}%")
+        
+        if self.sample_interval > 1:
+            self.last_sampling_stats = {
+                'skipped_frames': self._skipped_frames,
+                'backfilled_frames': self._backfilled_frames
+            }
+            print(f"自适应采样: 跳过 {self._skipped_frames} 帧, 回填 {self._backfilled_frames} 帧")
+        
+        if self.motion_gate:
+            checked = self._motion_checked_frames
+            self.last_motion_stats = {
+                'checked_frames': checked,
+                'skipped_frames': self._motion_skipped_frames,
+                'skip_ratio': round(self._motion_skipped_frames / checked, 4) if checked else 0,
+                'threshold': self.motion_threshold
+            }
+            print(f"运动门控: 检查 {checked} 帧, 静止跳过 {self._motion_skipped_frames} 帧 "
+                  f"({self.last_motion_stats['skip_ratio'] * 100:.1f}%)")
     
-    def detect_shots(self, video_path: str, progress_callback=None) -> List[Dict]:
+    def detect_shots(self, video_path: str, progress_callback=None,
+                     start_frame: int = 0, end_frame: int = None,
+                     checkpoint_path: str = None) -> List[Dict]:
         """
         检测视频中的所有进球
         
         Args:
             video_path: 视频文件路径
             progress_callback: 进度回调函数 callback(current_frame, total_frames)
+            start_frame: 起始帧（包含），帧数和时间戳仍按整段视频计算
+            end_frame: 结束帧（不包含），None 表示到视频末尾
+            checkpoint_path: 检查点文件路径，用于中断后恢复（见 iter_shots）
         
         Returns:
             进球列表，格式: [
                 {
                     'frame': 帧数,
+                    'up_frame': 球到达篮筐上方的帧,
                     'timestamp': 时间戳（秒）,
                     'made': True/False (是否进球)
                 },
                 ...
             ]
         """
+        shot_results = list(self.iter_shots(video_path, progress_callback, start_frame, end_frame,
+                                            checkpoint_path=checkpoint_path))
+        
+        # 打印统计信息
+        attempts = len(shot_results)
+        makes = len([s for s in shot_results if s['made']])
+        accuracy = (makes / attempts * 100) if attempts > 0 else 0
+        print(f"\n检测完成:")
+        print(f"  总投篮次数: {attempts}")
+        print(f"  进球次数: {makes}")
+        print(f"  命中率: {accuracy:.2f}%")
+        print(f"  检测到的进球时刻: {makes}")
+        
+        return shot_results
+    
+    def detect_shots_sharded(self, video_path: str, progress_callback=None) -> List[Dict]:
+        """
+        按时间切分视频，在多个工作进程中并行检测后合并结果
+        
+        每个分片向前多解码 shard_overlap_seconds 作为预热窗口以建立篮筐状态，
+        向后多解码同样时长以完成跨越分片边界的投篮；
+        每个投篮只归属于其进球帧所在的分片，合并时再去除重叠区内的重复投篮
+        
+        Args:
+            video_path: 视频文件路径
+            progress_callback: 进度回调函数 callback(current_frame, total_frames)，每完成一个分片回调一次
+        
+        Returns:
+            与 detect_shots 相同格式的进球列表
+        """
         cap = cv2.VideoCapture(video_path)
         
         if not cap.isOpened():
             raise ValueError(f"无法打开视频文件: {video_path}")
         
-        # 获取视频信息
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
         
-        print(f"视频信息 - FPS: {fps}, 总帧数: {total_frames}")
+        overlap = int(self.shard_overlap_seconds * fps)
+        shard_len = int(math.ceil(total_frames / self.num_workers))
         
-        # 初始化追踪变量
-        ball_pos = []
-        hoop_pos = []
-        frame_count = 0
+        # 分片太短时预热窗口占比过高，直接串行检测
+        if self.num_workers <= 1 or shard_len <= 2 * overlap:
+            return self.detect_shots(video_path, progress_callback)
         
-        # 投篮检测变量
-        up = False
-        down = False
-        up_frame = 0
-        down_frame = 0
+        shards = []
+        for own_start in range(0, total_frames, shard_len):
+            own_end = min(total_frames, own_start + shard_len)
+            shards.append((own_start, own_end))
         
-        # 结果存储
-        shot_results = []
-        makes = 0
-        attempts = 0
+        print(f"分片检测: {len(shards)} 个分片, 每片约 {shard_len} 帧, 重叠 {overlap} 帧")
         
-        while True:
-            ret, frame = cap.read()
-            
-            if not ret:
-                break
-            
-            # 运行YOLO检测
-            results = self.model(frame, stream=True, device=self.device, verbose=False)
-            
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    # 边界框
-                    x1, y1, x2, y2 = box.xyxy[0]
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    w, h = x2 - x1, y2 - y1
-                    
-                    # 置信度
-                    conf = math.ceil((box.conf[0] * 100)) / 100
-                    
-                    # 类别
-                    cls = int(box.cls[0])
-                    current_class = self.class_names[cls]
-                    
-                    center = (int(x1 + w / 2), int(y1 + h / 2))
-                    
-                    # 检测篮球
-                    if (conf > self.confidence_threshold or 
-                        (in_hoop_region(center, hoop_pos) and conf > 0.15)) and \
-                        current_class == "Basketball":
-                        ball_pos.append((center, frame_count, w, h, conf))
-                    
-                    # 检测篮筐
-                    if conf > 0.3 and current_class == "Basketball Hoop":
-                        hoop_pos.append((center, frame_count, w, h, conf))
-            
-            # 清理位置数据
-            ball_pos = clean_ball_pos(ball_pos, frame_count)
-            if len(hoop_pos) > 1:
-                hoop_pos = clean_hoop_pos(hoop_pos)
-            
-            # 投篮检测逻辑
-            if len(hoop_pos) > 0 and len(ball_pos) > 0:
-                # 检测球在上方区域
-                if not up:
-                    up = detect_up(ball_pos, hoop_pos)
-                    if up:
-                        up_frame = ball_pos[-1][1]
-                
-                # 检测球在下方区域
-                if up and not down:
-                    down = detect_down(ball_pos, hoop_pos)
-                    if down:
-                        down_frame = ball_pos[-1][1]
-                
-                # 判断是否完成一次投篮
-                if frame_count % 10 == 0:
-                    if up and down and up_frame < down_frame:
-                        attempts += 1
-                        
-                        # 判断是否进球
-                        is_made = score(ball_pos, hoop_pos)
-                        
-                        if is_made:
-                            makes += 1
-                        
-                        # 记录这次投篮
-                        shot_results.append({
-                            'frame': down_frame,
-                            'timestamp': round(down_frame / fps, 2),
-                            'made': is_made
-                        })
-                        
-                        print(f"检测到投篮 #{attempts} - "
-                              f"帧: {down_frame}, "
-                              f"时间: {down_frame/fps:.2f}s, "
-                              f"{'进球' if is_made else '未进'}")
-                        
-                        # 重置检测标志
-                        up = False
-                        down = False
-            
-            frame_count += 1
-            
-            # 进度回调
-            if progress_callback and frame_count % 30 == 0:
-                progress_callback(frame_count, total_frames)
+        # 按工作进程数平分CPU线程，避免进程间线程争用
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
         
-        cap.release()
-        
-        # 打印统计信息
-        accuracy = (makes / attempts * 100) if attempts > 0 else 0
-        print(f"\n检测完成:")
-        print(f"  总投篮次数: {attempts}")
-        print(f"  进球次数: {makes}")
-        print(f"  命中率: {accuracy:.2f}%")
-        print(f"  检测到的进球时刻: {len([s for s in shot_results if s['made']])}")
+        # 每个分片的投篮结果，按分片顺序存放
+        shot_results = [[] for _ in shards]
+        done_frames = 0
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.num_workers, mp_context=ctx) as executor:
+            futures = {
+                executor.submit(
+                    _detect_shard, self._shard_kwargs, video_path,
+                    own_start, own_end, overlap, threads_per_worker
+                ): index
+                for index, (own_start, own_end) in enumerate(shards)
+            }
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                own_start, own_end = shards[index]
+                shot_results[index] = future.result()
+                done_frames += own_end - own_start
+                print(f"  分片 {own_start}-{own_end} 完成")
+                if progress_callback:
+                    progress_callback(done_frames, total_frames)
         
-        return shot_results
+        return merge_shard_shots(shot_results, min_gap_frames=int(fps))
     
-    def detect_shots_with_clips(self, video_path: str, before_seconds=8, after_seconds=2, progress_callback=None) -> Dict:
+    def detect_shots_with_clips(self, video_path: str, before_seconds=8, after_seconds=2, progress_callback=None,
+                                checkpoint_path: str = None, merge_gap: float = 0.0) -> Dict:
         """
         检测进球并返回每个进球的剪辑时间段
         
@@ -183,18 +892,46 @@ class BasketballShotDetector:
             before_seconds: 进球前保留的秒数
             after_seconds: 进球后保留的秒数
             progress_callback: 进度回调函数 callback(current_frame, total_frames)
+            checkpoint_path: 检查点文件路径，用于中断后恢复（仅单进程检测时使用）
+            merge_gap: 重叠或间隔不超过该秒数的剪辑时间段合并为一段，None 表示每个进球单独一段
         
         Returns:
             {
                 'shots': 所有投篮列表,
                 'made_shots': 只包含进球的列表,
-                'clips': 剪辑时间段列表 [(start_time, end_time), ...]
-                'stats': 统计信息
+                'clips': 剪辑时间段列表 [{'start', 'end', 'shot_frame', 'shot_timestamp', 'shots'}, ...]，
+                    'shots' 为该段包含的进球，shot_frame/shot_timestamp 为其中第一个进球
+                'stats': 统计信息,
+                'timings': 分阶段计时（见 timing_summary），分片检测时为 None
             }
         """
         # 检测所有投篮
-        all_shots = self.detect_shots(video_path, progress_callback)
+        self.last_timing = None
+        if self.num_workers > 1:
+            all_shots = self.detect_shots_sharded(video_path, progress_callback)
+        else:
+            all_shots = self.detect_shots(video_path, progress_callback, checkpoint_path=checkpoint_path)
+        
+        result = self.summarize_shots(video_path, all_shots, before_seconds, after_seconds, merge_gap)
+        result['timings'] = self.last_timing
+        return result
+    
+    @staticmethod
+    def summarize_shots(video_path: str, all_shots: List[Dict], before_seconds=8, after_seconds=2,
+                        merge_gap: float = 0.0) -> Dict:
+        """
+        根据投篮列表计算剪辑时间段和统计信息（不运行检测，可直接用于缓存的检测结果）
         
+        Args:
+            video_path: 视频文件路径
+            all_shots: detect_shots 返回的投篮列表
+            before_seconds: 进球前保留的秒数
+            after_seconds: 进球后保留的秒数
+            merge_gap: 重叠或间隔不超过该秒数的剪辑时间段合并为一段，None 表示每个进球单独一段
+        
+        Returns:
+            与 detect_shots_with_clips 相同
+        """
         # 筛选出进球
         made_shots = [shot for shot in all_shots if shot['made']]
         
@@ -203,15 +940,16 @@ class BasketballShotDetector:
         duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
         cap.release()
         
+        # 时间接近的进球（如快攻连续得分）剪辑时间段会重叠，合并后共用一段，避免重复画面
         clips = []
-        for shot in made_shots:
-            start_time = max(0, shot['timestamp'] - before_seconds)
-            end_time = min(duration, shot['timestamp'] + after_seconds)
+        for start_time, end_time, shots in shot_windows(made_shots, before_seconds, after_seconds,
+                                                        duration, merge_gap):
             clips.append({
                 'start': start_time,
                 'end': end_time,
-                'shot_frame': shot['frame'],
-                'shot_timestamp': shot['timestamp']
+                'shot_frame': shots[0]['frame'],
+                'shot_timestamp': shots[0]['timestamp'],
+                'shots': shots
             })
         
         # 统计信息
@@ -231,6 +969,47 @@ class BasketballShotDetector:
         }
 
 
+def _detect_shard(detector_kwargs, video_path, own_start, own_end, overlap, num_threads):
+    """
+    工作进程入口：检测一个分片，只返回进球帧落在 [own_start, own_end) 内的投篮
+    """
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(1)
+    
+    detector = BasketballShotDetector(**detector_kwargs)
+    shots = detector.detect_shots(
+        video_path,
+        start_frame=max(0, own_start - overlap),
+        end_frame=own_end + overlap
+    )
+    return [shot for shot in shots if own_start <= shot['frame'] < own_end]
+
+
+def merge_shard_shots(shard_shots: List[List[Dict]], min_gap_frames: int) -> List[Dict]:
+    """
+    合并各分片的投篮结果
+    
+    分片边界附近的同一次投篮可能被相邻两个分片以略有不同的进球帧各记录一次：
+    只有分属相邻分片（即跨越分片边界）且间隔小于 min_gap_frames 的两次投篮视为重复，
+    保留较早的一次；同一分片内的投篮（如补篮）即使间隔很短也都保留
+    
+    Args:
+        shard_shots: 按分片顺序排列的各分片投篮列表
+    """
+    tagged = sorted(((shot['frame'], index, shot) for index, shots in enumerate(shard_shots) for shot in shots),
+                    key=lambda item: item[0])
+    
+    merged = []
+    last_frame, last_index = None, None
+    for frame, index, shot in tagged:
+        if last_index is not None and index != last_index and frame - last_frame < min_gap_frames:
+            continue
+        merged.append(shot)
+        last_frame, last_index = frame, index
+    return merged
+
+
 # 测试代码
 if __name__ == "__main__":
     # 使用示例
@@ -0,0 +1,256 @@
+# shot_tracker.py - 增量式投篮状态机
+import numpy as np
+from utils import (
+    score, detect_down, detect_up,
+    clean_hoop_pos, clean_ball_pos,
+    filter_detections, detection_entries,
+    Track, BALL_TRACK_CAPACITY, HOOP_TRACK_CAPACITY
+)
+from ball_kalman import BallKalmanFilter
+from typing import Dict, Optional
+
+
+class ShotTracker:
+    """
+    增量式投篮状态机
+
+    逐帧输入检测框，维护篮球/篮筐轨迹和 up/down 状态，
+    一次投篮判定完成时立即返回投篮事件。
+    BasketballShotDetector（批量检测）和 ShotDetector（实时显示）共用这一套逻辑
+    """
+
+    def __init__(self, ball_conf=0.25, hoop_conf=0.3, near_hoop_conf=0.15, kalman=False):
+        """
+        初始化状态机
+
+        Args:
+            ball_conf: 篮球置信度阈值
+            hoop_conf: 篮筐置信度阈值
+            near_hoop_conf: 球在篮筐区域内时使用的较低置信度阈值
+            kalman: 是否用卡尔曼滤波跟踪篮球。启用后 ball_pos 记录滤波后的轨迹，
+                漏检或未推理的帧用预测位置（conf 为 0）补齐；最近一次检测之后
+                bridge_frames 帧内的预测位置参与 detect_up/detect_down/score，更久的外推不参与
+        """
+        self.ball_conf = ball_conf
+        self.hoop_conf = hoop_conf
+        self.near_hoop_conf = near_hoop_conf
+
+        # 轨迹（定长环形缓冲区，内存占用与视频长度无关）
+        self.ball_pos = Track(BALL_TRACK_CAPACITY)
+        self.hoop_pos = Track(HOOP_TRACK_CAPACITY)
+
+        # 投篮检测变量（上方区域和下方区域）
+        self.up = False
+        self.down = False
+        self.up_frame = 0
+        self.down_frame = 0
+
+        # down 由卡尔曼预测位置得到、尚未被之后的检测确认
+        self.down_predicted = False
+        # 已推进过 up/down 状态的最后一个篮球位置的帧号
+        self.checked_frame = -1
+
+        self.makes = 0
+        self.attempts = 0
+
+        self.ball_filter = BallKalmanFilter() if kalman else None
+
+    def add_detections(self, det, frame_count):
+        """
+        把一帧的检测框加入轨迹
+
+        Args:
+            det: 检测框数组 (N, 6)，格式见 utils.boxes_to_array；None 表示该帧未推理
+            frame_count: 当前帧序号
+
+        Returns:
+            (被接受的篮球框下标, 被接受的篮筐框下标)
+        """
+        if det is None:
+            empty = np.zeros(0, dtype=np.int64)
+            self._add_ball(None, frame_count)
+            return empty, empty
+
+        ball_idx, hoop_idx = filter_detections(
+            det, self.hoop_pos, ball_conf=self.ball_conf, hoop_conf=self.hoop_conf,
+            near_hoop_conf=self.near_hoop_conf
+        )
+        self._add_ball(detection_entries(det, ball_idx, frame_count), frame_count)
+        self.hoop_pos.extend(detection_entries(det, hoop_idx, frame_count))
+        return ball_idx, hoop_idx
+
+    def _add_ball(self, entries, frame_count):
+        """
+        把一帧的篮球位置加入轨迹；启用卡尔曼滤波时加入滤波器输出的位置
+
+        Args:
+            entries: 篮球位置记录列表；None 表示该帧未推理
+            frame_count: 当前帧序号
+        """
+        if self.ball_filter is None:
+            if entries:
+                self.ball_pos.extend(entries)
+            return
+
+        # 与 clean_ball_pos 相同的形状检查，明显不是球的框不参与匹配
+        candidates = None
+        if entries is not None:
+            candidates = [entry for entry in entries
+                          if not (entry[2] * 1.4 < entry[3] or entry[3] * 1.4 < entry[2])]
+        entries, restarted = self.ball_filter.step(frame_count, candidates)
+        if restarted:
+            # 新轨迹从更早的检测框开始：丢弃旧轨迹在这段时间内外推出的位置，
+            # 由这些位置得到的 up/down 状态一并撤销（球碰筐改变了方向，外推的位置是错的）
+            while len(self.ball_pos) > 0 and self.ball_pos[-1][4] == 0:
+                self.ball_pos.pop()
+            last_frame = self.ball_pos[-1][1] if len(self.ball_pos) > 0 else -1
+            if self.down and self.down_frame > last_frame:
+                self.down = False
+                self.down_predicted = False
+            if self.up and self.up_frame > last_frame:
+                self.up = False
+            entries = [entry for entry in entries if entry[1] > last_frame]
+            self.checked_frame = min(self.checked_frame, last_frame)
+        self.ball_pos.extend(entries)
+
+    def _bridged(self, index) -> bool:
+        """
+        ball_pos[index] 能否参与投篮判定：检测到的位置，
+        或距前一个检测到的位置不超过 bridge_frames 帧的预测位置
+        """
+        entry = self.ball_pos[index]
+        if self.ball_filter is None or entry[4] > 0:
+            return True
+        horizon = self.ball_filter.bridge_frames
+        i = index % len(self.ball_pos) - 1
+        while i >= 0 and entry[1] - self.ball_pos[i][1] <= horizon:
+            if self.ball_pos[i][4] > 0:
+                return True
+            i -= 1
+        return False
+
+    def clean(self, frame_count):
+        """清理轨迹中的异常点和过旧的点"""
+        self.ball_pos = clean_ball_pos(self.ball_pos, frame_count)
+        if len(self.hoop_pos) > 1:
+            self.hoop_pos = clean_hoop_pos(self.hoop_pos)
+
+    def _advance(self, index):
+        """用 ball_pos[index] 推进 up/down 状态"""
+        entry = [self.ball_pos[index]]
+
+        # 由预测位置得到的 down 用之后第一个检测到的位置确认：球仍在下方区域才保留
+        if self.down_predicted and entry[0][4] > 0:
+            self.down_predicted = False
+            self.down = detect_down(entry, self.hoop_pos)
+
+        # 卡尔曼长时间外推出的位置只用于补齐轨迹，不推进 up/down 状态：
+        # 球碰筐改变方向时外推位置会继续沿旧抛物线下落，产生错误的 down
+        if not self._bridged(index):
+            return
+
+        # 检测球在上方区域
+        if not self.up:
+            self.up = detect_up(entry, self.hoop_pos)
+            if self.up:
+                self.up_frame = entry[0][1]
+
+        # 检测球在下方区域（只有先经过上方区域才检测）
+        if self.up and not self.down:
+            self.down = detect_down(entry, self.hoop_pos)
+            if self.down:
+                self.down_frame = entry[0][1]
+                self.down_predicted = self.ball_filter is not None and entry[0][4] == 0
+
+    def check_shot(self, frame_count) -> Optional[Dict]:
+        """
+        推进 up/down 状态，判定是否完成一次投篮
+
+        Returns:
+            完成投篮时返回 {'frame': 进球帧, 'up_frame': 上方区域帧, 'made': 是否进球}，否则返回 None
+        """
+        if len(self.hoop_pos) == 0 or len(self.ball_pos) == 0:
+            return None
+
+        # 本帧新加入的位置依次推进 up/down 状态：卡尔曼候选链确认时一次加入多帧的位置
+        if self.ball_filter is None:
+            indices = [len(self.ball_pos) - 1]
+        else:
+            first = len(self.ball_pos)
+            while first > 0 and self.ball_pos[first - 1][1] > self.checked_frame:
+                first -= 1
+            indices = range(first, len(self.ball_pos))
+        for i in indices:
+            self._advance(i)
+        self.checked_frame = self.ball_pos[-1][1]
+
+        # 每10帧判断一次：球先上后下则记一次投篮并重置
+        # 由预测位置得到的 down 要等到之后再检测到球才确定；轨迹结束后，
+        # 还有待确认的候选链时也要等待（候选链确认后重新开始的轨迹可能撤销它）
+        pending = self.down_predicted and (self.ball_filter.active or bool(self.ball_filter.chains))
+        if frame_count % 10 == 0 and not pending:
+            if self.up and self.down and self.up_frame < self.down_frame:
+                self.attempts += 1
+
+                # 判断是否进球（长时间外推出的位置不参与判定）
+                ball_pos = self.ball_pos
+                if self.ball_filter is not None:
+                    ball_pos = [entry for i, entry in enumerate(ball_pos) if self._bridged(i)]
+                is_made = score(ball_pos, self.hoop_pos)
+                if is_made:
+                    self.makes += 1
+
+                # 重置检测标志
+                self.up = False
+                self.down = False
+                self.down_predicted = False
+
+                return {
+                    'frame': self.down_frame,
+                    'up_frame': self.up_frame,
+                    'made': is_made
+                }
+
+        return None
+
+    def state_dict(self) -> Dict:
+        """导出可 JSON 序列化的完整状态（用于检查点）"""
+        return {
+            'ball_pos': self.ball_pos.to_list(),
+            'hoop_pos': self.hoop_pos.to_list(),
+            'up': self.up,
+            'down': self.down,
+            'up_frame': self.up_frame,
+            'down_frame': self.down_frame,
+            'down_predicted': self.down_predicted,
+            'checked_frame': self.checked_frame,
+            'makes': self.makes,
+            'attempts': self.attempts,
+            'ball_filter': self.ball_filter.state_dict() if self.ball_filter is not None else None
+        }
+
+    def load_state_dict(self, state: Dict):
+        """从 state_dict() 导出的状态恢复"""
+        self.ball_pos = Track(BALL_TRACK_CAPACITY, state['ball_pos'])
+        self.hoop_pos = Track(HOOP_TRACK_CAPACITY, state['hoop_pos'])
+        self.up = state['up']
+        self.down = state['down']
+        self.up_frame = state['up_frame']
+        self.down_frame = state['down_frame']
+        self.down_predicted = state.get('down_predicted', False)
+        self.checked_frame = state.get('checked_frame', -1)
+        self.makes = state['makes']
+        self.attempts = state['attempts']
+        if self.ball_filter is not None and state.get('ball_filter'):
+            self.ball_filter.load_state_dict(state['ball_filter'])
+
+    def update(self, det, frame_count) -> Optional[Dict]:
+        """
+        处理一帧：加入检测框、清理轨迹、判定投篮
+
+        Returns:
+            同 check_shot
+        """
+        self.add_detections(det, frame_count)
+        self.clean(frame_count)
+        return self.check_shot(frame_count)
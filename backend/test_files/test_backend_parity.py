@@ -0,0 +1,116 @@
+"""
+推理后端一致性测试：ONNX / OpenVINO 与 PyTorch 在同一批视频帧上的检测结果对比
+
+逐帧按类别和 IoU 匹配两个后端的检测框，统计匹配率和置信度偏差，
+低于阈值时以非零状态退出
+"""
+import sys
+import os
+
+# 获取当前脚本所在目录的父目录（即backend目录）
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 将backend目录添加到Python搜索路径
+sys.path.append(backend_dir)
+
+import cv2
+import numpy as np
+from inference_backend import load_model, backend_device
+from utils import get_device, boxes_to_array
+
+IOU_THRESHOLD = 0.9       # 同一目标的框 IoU 下限
+CONF_TOLERANCE = 0.05     # 同一目标的置信度偏差上限
+MIN_MATCH_RATE = 0.98     # 通过测试所需的最低匹配率
+
+
+def read_frames(video_path, num_frames, stride):
+    """每隔 stride 帧取一帧，最多 num_frames 帧"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    frame_index = 0
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if frame_index % stride == 0:
+            frames.append(frame)
+        frame_index += 1
+    cap.release()
+    return frames
+
+
+def detect(model, device, frames):
+    return [boxes_to_array(next(iter(model(frame, stream=True, device=device, verbose=False))).boxes)
+            for frame in frames]
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0
+
+
+def match_frame(ref, det):
+    """贪心匹配一帧的检测框，返回 (匹配数, 总框数, 置信度偏差列表)"""
+    used = set()
+    conf_diffs = []
+    for box in ref[np.argsort(-ref[:, 4])]:
+        best, best_iou = None, IOU_THRESHOLD
+        for j, other in enumerate(det):
+            if j in used or other[5] != box[5]:
+                continue
+            overlap = iou(box, other)
+            if overlap >= best_iou:
+                best, best_iou = j, overlap
+        if best is not None:
+            used.add(best)
+            conf_diffs.append(abs(box[4] - det[best][4]))
+    matched = sum(1 for diff in conf_diffs if diff <= CONF_TOLERANCE)
+    return matched, max(len(ref), len(det)), conf_diffs
+
+
+def test_parity(video_path, backend='onnx', num_frames=100, stride=10):
+    print("=" * 60)
+    print(f"🔬 推理后端一致性测试: torch vs {backend}")
+    print("=" * 60)
+
+    if not os.path.exists(video_path):
+        print(f"❌ 错误: 视频文件不存在: {video_path}")
+        return False
+
+    model_path = os.path.join(backend_dir, 'best.pt')
+    frames = read_frames(video_path, num_frames, stride)
+    print(f"📹 视频文件: {video_path}, 取 {len(frames)} 帧")
+
+    device = get_device()
+    reference = detect(load_model(model_path, 'torch'), device, frames)
+    candidate = detect(load_model(model_path, backend), backend_device(backend, device), frames)
+
+    matched = total = 0
+    conf_diffs = []
+    for ref, det in zip(reference, candidate):
+        m, t, diffs = match_frame(ref, det)
+        matched += m
+        total += t
+        conf_diffs += diffs
+
+    match_rate = matched / total if total else 1.0
+    print(f"   检测框: {total} 个, 匹配 {matched} 个, 匹配率 {match_rate * 100:.2f}%")
+    if conf_diffs:
+        print(f"   置信度偏差: 平均 {np.mean(conf_diffs):.4f}, 最大 {np.max(conf_diffs):.4f}")
+
+    passed = match_rate >= MIN_MATCH_RATE
+    print("✅ 一致性测试通过" if passed else f"❌ 匹配率低于 {MIN_MATCH_RATE * 100:.0f}%")
+    return passed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法: python test_backend_parity.py <video_path> [onnx|openvino] [帧数]")
+        print("示例: python test_backend_parity.py test_video.mp4 onnx 100")
+        sys.exit(1)
+
+    backend = sys.argv[2] if len(sys.argv) > 2 else 'onnx'
+    num_frames = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    sys.exit(0 if test_parity(sys.argv[1], backend, num_frames) else 1)
@@ -0,0 +1,232 @@
+"""
+篮球卡尔曼跟踪的鲁棒性测试（不需要模型和视频）
+
+逐帧生成模拟检测框：固定篮筐 + 若干次投篮（空心进球、碰筐弹起后进球、碰筐弹出未进），
+加入漏检、位置抖动和随机位置的误检篮球框，分别用普通轨迹和卡尔曼跟踪运行 ShotTracker，
+与真实的投篮数、进球数对比
+"""
+import sys
+import os
+import random
+
+# 获取当前脚本所在目录的父目录（即backend目录）
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 将backend目录添加到Python搜索路径
+sys.path.append(backend_dir)
+
+import numpy as np
+from shot_tracker import ShotTracker
+from ball_kalman import BallKalmanFilter
+
+WIDTH, HEIGHT = 1280, 720
+HOOP_X, HOOP_Y, HOOP_W, HOOP_H = 640, 250, 60, 50
+BALL_SIZE = 28
+SHOT_PERIOD = 150
+
+# 每次投篮的类型，按顺序循环：空心进球、碰筐弹起后进球、碰筐弹出
+SHOT_KINDS = ('swish', 'rim_in', 'rim_out')
+
+
+def ball_path(kind, start_x):
+    """
+    一次投篮中每帧的篮球中心（帧号相对于出手），球落出画面后结束
+
+    出手后 45 帧到达篮筐；碰筐的球在篮筐边缘突然改变方向
+    """
+    points = []
+    rim_left = HOOP_X - HOOP_W // 2
+    arrive_x = HOOP_X if kind == 'swish' else rim_left - 4
+    rim_y = HOOP_Y - HOOP_H // 2
+
+    # 抛物线飞向篮筐
+    for t in range(46):
+        s = t / 45
+        x = start_x + (arrive_x - start_x) * s
+        y = 650 - 1600 * s + (rim_y - 650 + 1600) * s * s
+        points.append((x, y))
+
+    x, y = points[-1]
+    if kind == 'swish':
+        # 垂直下落穿过篮筐
+        while y < HEIGHT:
+            y += 14
+            points.append((x, y))
+    elif kind == 'rim_in':
+        # 碰筐向上弹起，落回篮筐中心上方，再垂直落下
+        vx, vy = (HOOP_X - x) / 16, -12.0
+        for _ in range(16):
+            x, y = x + vx, y + vy
+            vy += 1.5
+            points.append((x, y))
+        while y < HEIGHT:
+            y += 14
+            points.append((x, y))
+    else:
+        # 碰筐向外侧弹出，落在篮筐外
+        vx, vy = -9.0, -10.0
+        while y < HEIGHT:
+            x, y = x + vx, y + vy
+            vy += 1.5
+            points.append((x, y))
+    return points
+
+
+def simulate(seed, num_shots=9, detect_rate=0.85, noise_rate=0.3):
+    """
+    生成模拟检测框
+
+    Returns:
+        (每帧的检测框数组列表, 真实投篮数, 真实进球数)
+    """
+    rng = random.Random(seed)
+    num_frames = num_shots * SHOT_PERIOD + 60
+    ball = {}
+    for i in range(num_shots):
+        kind = SHOT_KINDS[i % len(SHOT_KINDS)]
+        path = ball_path(kind, rng.uniform(200, 420))
+        for t, point in enumerate(path):
+            ball[i * SHOT_PERIOD + 20 + t] = point
+
+    frames = []
+    for frame in range(num_frames):
+        rows = [[HOOP_X - HOOP_W / 2, HOOP_Y - HOOP_H / 2, HOOP_X + HOOP_W / 2, HOOP_Y + HOOP_H / 2, 0.9, 1]]
+        if frame in ball and rng.random() < detect_rate:
+            x, y = ball[frame]
+            x, y = x + rng.gauss(0, 2), y + rng.gauss(0, 2)
+            if 0 <= y < HEIGHT:
+                half = BALL_SIZE / 2
+                rows.append([x - half, y - half, x + half, y + half, rng.uniform(0.5, 0.9), 0])
+        if rng.random() < noise_rate:
+            x, y = rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT)
+            half = rng.uniform(10, 20)
+            rows.append([x - half, y - half, x + half, y + half, rng.uniform(0.3, 0.9), 0])
+        frames.append(np.array(rows, dtype=np.float32))
+
+    makes = sum(1 for i in range(num_shots) if SHOT_KINDS[i % len(SHOT_KINDS)] != 'rim_out')
+    return frames, num_shots, makes
+
+
+def ball_entry(x, y, frame, conf=0.8):
+    return (x, y), frame, BALL_SIZE, BALL_SIZE, conf
+
+
+def test_filter():
+    """直接检查滤波器：孤立误检不产生轨迹，碰筐改变方向后很快重新捕获"""
+    failed = False
+
+    # 相隔很远的孤立检测框：每个都不应开始轨迹
+    kf = BallKalmanFilter()
+    rng = random.Random(0)
+    outputs = 0
+    for frame in range(300):
+        candidates = []
+        if frame % 3 == 0:
+            candidates.append(ball_entry(rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT), frame))
+        entries, _ = kf.step(frame, candidates)
+        outputs += len(entries)
+    print(f"  孤立误检产生的轨迹点: {outputs}")
+    if outputs:
+        print("  ❌ 单个误检开始了轨迹")
+        failed = True
+
+    # 碰筐弹出：轨迹应在 confirm_hits 帧内重新开始，期间不外推旧抛物线
+    kf = BallKalmanFilter()
+    path = ball_path('rim_out', 300)
+    bounce = 46
+    restart_frame = None
+    for frame, (x, y) in enumerate(path):
+        entries, restarted = kf.step(frame, [ball_entry(x, y, frame)])
+        if restarted and frame >= bounce:
+            restart_frame = frame
+            break
+    print(f"  碰筐帧 {bounce}，重新捕获帧 {restart_frame}")
+    if restart_frame is None or restart_frame - bounce > kf.confirm_hits:
+        print("  ❌ 碰筐后没有及时重新捕获")
+        failed = True
+    return failed
+
+
+def run(frames, kalman, sample_interval=1):
+    """sample_interval > 1 时只对每隔 sample_interval 帧做推理，其余帧传入 None"""
+    tracker = ShotTracker(kalman=kalman)
+    for frame, det in enumerate(frames):
+        tracker.update(det if frame % sample_interval == 0 else None, frame)
+    return tracker.attempts, tracker.makes
+
+
+def test_shots():
+    """整段模拟视频：卡尔曼跟踪的投篮数、进球数误差不应超过普通轨迹"""
+    failed = False
+    for noise_rate in (0.0, 0.3):
+        totals = {'truth': [0, 0], 'baseline': [0, 0], 'kalman': [0, 0]}
+        errors = {'baseline': 0, 'kalman': 0}
+        for seed in range(10):
+            frames, attempts, makes = simulate(seed, noise_rate=noise_rate)
+            totals['truth'][0] += attempts
+            totals['truth'][1] += makes
+            for name, kalman in (('baseline', False), ('kalman', True)):
+                result = run(frames, kalman)
+                totals[name][0] += result[0]
+                totals[name][1] += result[1]
+                errors[name] += abs(result[0] - attempts) + abs(result[1] - makes)
+
+        print(f"\n  误检率 {noise_rate:.0%}（10 段模拟视频）:")
+        for name, (attempts, makes) in totals.items():
+            error = f", 误差 {errors[name]}" if name in errors else ""
+            print(f"  {name:>10}: 投篮 {attempts}, 进球 {makes}{error}")
+
+        if errors['kalman'] > errors['baseline']:
+            print("  ❌ 卡尔曼跟踪的误差超过普通轨迹")
+            failed = True
+    return failed
+
+
+def test_sparse():
+    """跳帧推理（未推理帧传入 None）：卡尔曼跟踪应仍能找回全部投篮和进球"""
+    failed = False
+    for sample_interval in (2, 3):
+        for noise_rate in (0.0, 0.3):
+            truth = [0, 0]
+            totals = {'baseline': [0, 0], 'kalman': [0, 0]}
+            errors = {'baseline': 0, 'kalman': 0}
+            for seed in range(10):
+                frames, attempts, makes = simulate(seed, noise_rate=noise_rate)
+                truth[0] += attempts
+                truth[1] += makes
+                for name, kalman in (('baseline', False), ('kalman', True)):
+                    result = run(frames, kalman, sample_interval)
+                    totals[name][0] += result[0]
+                    totals[name][1] += result[1]
+                    errors[name] += abs(result[0] - attempts) + abs(result[1] - makes)
+
+            print(f"\n  每 {sample_interval} 帧推理一次，误检率 {noise_rate:.0%}: 真实 投篮 {truth[0]}, 进球 {truth[1]}")
+            for name, (attempts, makes) in totals.items():
+                print(f"  {name:>10}: 投篮 {attempts}, 进球 {makes}, 误差 {errors[name]}")
+
+            if totals['kalman'][0] != truth[0] or abs(totals['kalman'][1] - truth[1]) > 1:
+                print("  ❌ 卡尔曼跟踪在跳帧推理下丢失了投篮或进球")
+                failed = True
+            if errors['kalman'] > errors['baseline']:
+                print("  ❌ 卡尔曼跟踪的误差超过普通轨迹")
+                failed = True
+    return failed
+
+
+def main():
+    print("=" * 60)
+    print("篮球卡尔曼跟踪鲁棒性测试")
+    print("=" * 60)
+
+    print("\n1. 滤波器")
+    failed = test_filter()
+    print("\n2. 投篮判定")
+    failed = test_shots() or failed
+    print("\n3. 跳帧推理")
+    failed = test_sparse() or failed
+
+    print("\n❌ 测试失败" if failed else "\n✅ 测试通过")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
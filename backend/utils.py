@@ -1,12 +1,80 @@
 # utils.py - 工具函数库
+import hashlib
 import math
 import cv2
 import numpy as np
 import torch
 import os
+import time
+import threading
+from collections import deque
 from typing import List, Tuple, Dict
 import json
 
+# 轨迹缓冲区容量：篮球轨迹只保留约30帧内的点，篮筐轨迹最多保留25个点
+BALL_TRACK_CAPACITY = 128
+HOOP_TRACK_CAPACITY = 32
+
+
+class Track(deque):
+    """
+    定长环形缓冲区实现的篮球/篮筐轨迹
+    
+    记录格式与原先的列表元素相同: ((x, y), frame, w, h, conf)，
+    支持 len()、下标访问（含负下标）、迭代、append/extend 以及首尾 pop，
+    因此 clean_ball_pos、detect_up、score 等函数可以直接使用。
+    基于 collections.deque(maxlen=capacity)：下标访问和迭代都在 C 中完成、直接返回记录元组，
+    追加和淘汰都是 O(1)；写满后再追加会覆盖最旧的记录，内存占用不随视频长度增长
+    """
+    __slots__ = ()
+    
+    def __init__(self, capacity: int, entries=None):
+        super().__init__(maxlen=capacity)
+        if entries:
+            self.extend(entries)
+    
+    @property
+    def capacity(self) -> int:
+        return self.maxlen
+    
+    def __eq__(self, other):
+        return list(self) == list(other)
+    
+    def __repr__(self):
+        return f"Track({list(self)!r})"
+    
+    # deque 的复制和序列化按 (可迭代对象, maxlen) 重建，与本类的构造参数不同
+    def __copy__(self):
+        return self.__class__(self.maxlen, self)
+    
+    copy = __copy__
+    
+    def __reduce__(self):
+        return self.__class__, (self.maxlen, list(self))
+    
+    def append(self, entry):
+        """追加一条记录，已满时覆盖最旧的记录"""
+        # 统一为元组（从检查点 JSON 恢复的记录是列表）
+        (x, y), frame, w, h, conf = entry
+        super().append(((x, y), frame, w, h, conf))
+    
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+    
+    def pop(self, index: int = -1):
+        """移除并返回首条（index=0）或末条（index=-1）记录"""
+        if index == 0:
+            return self.popleft()
+        if index == -1 or index == len(self) - 1:
+            return super().pop()
+        raise IndexError("Track 只支持移除首条或末条记录")
+    
+    def to_list(self) -> List:
+        """导出为原先的列表格式"""
+        return list(self)
+
+
 def get_device():
     """自动检测并返回最佳计算设备"""
     if torch.cuda.is_available():
@@ -222,6 +290,118 @@ def in_hoop_region(center, hoop_pos):
         return True
     return False
 
+def boxes_to_array(boxes, offset: Tuple[int, int] = (0, 0),
+                   scale: Tuple[float, float] = (1.0, 1.0)) -> np.ndarray:
+    """
+    把单帧 YOLO 检测框一次性转换为 NumPy 数组
+    
+    Args:
+        boxes: YOLO 结果中的 r.boxes
+        offset: 检测图像左上角在推理帧中的坐标（裁剪推理时使用）
+        scale: 推理帧到原始视频的缩放系数 (sx, sy)（解码时缩小了分辨率时使用）
+    
+    Returns:
+        (N, 6) 数组，每行为 [x1, y1, x2, y2, conf, cls]；
+        坐标已映射回原始视频分辨率并取整，置信度已向上取整到两位小数
+    """
+    data = boxes.data.cpu().numpy()
+    if len(data) == 0:
+        return np.zeros((0, 6), dtype=np.float64)
+    
+    det = np.empty((len(data), 6), dtype=np.float64)
+    # 加整数偏移在 float64 下是精确的，不缩放时与 int(x) + offset 结果一致
+    det[:, 0:4] = data[:, 0:4]
+    det[:, [0, 2]] += offset[0]
+    det[:, [1, 3]] += offset[1]
+    if scale != (1.0, 1.0):
+        det[:, [0, 2]] *= scale[0]
+        det[:, [1, 3]] *= scale[1]
+    det[:, 0:4] = np.trunc(det[:, 0:4])
+    # 与 math.ceil(conf * 100) / 100 一致（乘法在 float32 下进行）
+    det[:, 4] = np.ceil(data[:, 4] * np.float32(100)).astype(np.float64) / 100
+    det[:, 5] = data[:, 5]
+    return det
+
+def filter_detections(det: np.ndarray, hoop_pos: List, ball_conf: float, hoop_conf: float,
+                      near_hoop_conf: float = 0.15) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按类别、置信度和篮筐区域筛选一帧的检测框
+    
+    与逐框循环的结果完全一致：球是否在篮筐区域内，以该框之前最近一个被接受的
+    篮筐为准（同一帧中排在前面的篮筐框也算），没有则使用 hoop_pos[-1]
+    
+    Args:
+        det: boxes_to_array 返回的 (N, 6) 数组
+        hoop_pos: 本帧之前的篮筐位置列表
+        ball_conf: 篮球置信度阈值
+        hoop_conf: 篮筐置信度阈值
+        near_hoop_conf: 球在篮筐区域内时使用的较低置信度阈值
+    
+    Returns:
+        (篮球框下标, 篮筐框下标)，均按原始框顺序排列
+    """
+    n = len(det)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    
+    coords = det[:, 0:4].astype(np.int64)
+    w = coords[:, 2] - coords[:, 0]
+    h = coords[:, 3] - coords[:, 1]
+    cx = (coords[:, 0] + w / 2).astype(np.int64)
+    cy = (coords[:, 1] + h / 2).astype(np.int64)
+    conf = det[:, 4]
+    cls = det[:, 5].astype(np.int64)
+    
+    hoop_mask = (cls == 1) & (conf > hoop_conf)
+    
+    # 每个框之前最近一个被接受的篮筐框下标，-1 表示没有
+    last_hoop = np.maximum.accumulate(np.where(hoop_mask, np.arange(n), -1))
+    prev_hoop = np.concatenate(([-1], last_hoop[:-1]))
+    
+    if hoop_pos:
+        (hx, hy), _, hw, hh, _ = hoop_pos[-1]
+        has_hoop = np.ones(n, dtype=bool)
+    else:
+        hx = hy = hw = hh = 0
+        has_hoop = prev_hoop >= 0
+    
+    same_frame = prev_hoop >= 0
+    ref = np.maximum(prev_hoop, 0)
+    ref_x = np.where(same_frame, cx[ref], hx)
+    ref_y = np.where(same_frame, cy[ref], hy)
+    ref_w = np.where(same_frame, w[ref], hw)
+    ref_h = np.where(same_frame, h[ref], hh)
+    
+    # 与 in_hoop_region 相同的区域判断
+    near_hoop = (has_hoop &
+                 (ref_x - ref_w < cx) & (cx < ref_x + ref_w) &
+                 (ref_y - ref_h < cy) & (cy < ref_y + 0.5 * ref_h))
+    
+    ball_mask = (cls == 0) & ((conf > ball_conf) | (near_hoop & (conf > near_hoop_conf)))
+    
+    return np.flatnonzero(ball_mask), np.flatnonzero(hoop_mask)
+
+def detection_entries(det: np.ndarray, idx: np.ndarray, frame_count: int) -> List:
+    """
+    把筛选后的检测框转换为追踪使用的位置记录
+    
+    Returns:
+        [((x, y), frame_count, w, h, conf), ...]
+    """
+    if len(idx) == 0:
+        return []
+    
+    coords = det[idx, 0:4].astype(np.int64)
+    w = coords[:, 2] - coords[:, 0]
+    h = coords[:, 3] - coords[:, 1]
+    cx = (coords[:, 0] + w / 2).astype(np.int64)
+    cy = (coords[:, 1] + h / 2).astype(np.int64)
+    
+    return [((x, y), frame_count, bw, bh, c)
+            for x, y, bw, bh, c in zip(cx.tolist(), cy.tolist(), w.tolist(), h.tolist(),
+                                       det[idx, 4].tolist())]
+
 def fit_parabola(positions: List[Tuple[int, int]]) -> np.ndarray:
     """
     拟合抛物线轨迹
@@ -300,10 +480,10 @@ def score(ball_pos, hoop_pos):
                 y.append(ball_pos[i + 1][0][1])
             break
 
-    # Create line from two points
-    if len(x) > 1:
-        m, b = np.polyfit(x, y, 1)
-        predicted_x = ((hoop_pos[-1][0][1] - 0.5 * hoop_pos[-1][3]) - b) / m
+    # Create line from two points (solved directly so a vertical drop, where both
+    # points share the same x, still crosses the rim height at that x)
+    if len(x) > 1 and y[1] != y[0]:
+        predicted_x = x[0] + (x[1] - x[0]) * (rim_height - y[0]) / (y[1] - y[0])
         rim_x1 = hoop_pos[-1][0][0] - 0.4 * hoop_pos[-1][2]
         rim_x2 = hoop_pos[-1][0][0] + 0.4 * hoop_pos[-1][2]
 
@@ -404,6 +584,19 @@ def load_detection_results(input_path: str) -> List[Dict]:
     with open(input_path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def file_content_hash(file_path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """
+    计算文件内容的 SHA-256 摘要（分块读取，内存占用固定）
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def format_time(seconds: float) -> str:
     """
     将秒数格式化为 HH:MM:SS 或 MM:SS
@@ -417,6 +610,41 @@ def format_time(seconds: float) -> str:
     else:
         return f"{minutes}:{secs:02d}"
 
+def shot_windows(made_shots: List[Dict], before: float, after: float, duration: float,
+                 merge_gap: float = 0.0) -> List[Tuple[float, float, List[Dict]]]:
+    """
+    计算进球的剪辑时间窗，并合并重叠的时间窗
+    
+    Args:
+        made_shots: 进球列表（含 'timestamp'）
+        before: 进球前保留的秒数
+        after: 进球后保留的秒数
+        duration: 视频时长（秒）
+        merge_gap: 间隔不超过该秒数的相邻时间窗也合并为一段；None 表示不合并，每个进球一段
+    
+    Returns:
+        [(开始秒, 结束秒, [该段包含的进球, ...]), ...]
+    """
+    windows = [(max(0, shot['timestamp'] - before), min(duration, shot['timestamp'] + after), [shot])
+               for shot in made_shots]
+    if merge_gap is None:
+        return windows
+    return merge_windows(windows, merge_gap)
+
+def merge_windows(windows: List[Tuple[float, float, List]],
+                  merge_gap: float = 0.0) -> List[Tuple[float, float, List]]:
+    """
+    按开始时间排序并合并重叠（或间隔不超过 merge_gap 秒）的时间窗，各段附带的列表依次拼接
+    """
+    merged = []
+    for start, end, items in sorted(windows, key=lambda w: w[0]):
+        if merged and start - merged[-1][1] <= merge_gap:
+            last_start, last_end, last_items = merged[-1]
+            merged[-1] = (last_start, max(last_end, end), last_items + items)
+        else:
+            merged.append((start, end, list(items)))
+    return merged
+
 def create_thumbnail(video_path: str, output_path: str, timestamp: float = 0):
     """
     从视频中提取缩略图
@@ -509,8 +737,116 @@ def estimate_ball_velocity(ball_positions: List[Tuple[Tuple[int, int], int]], fp
     avg_velocity_per_frame = np.mean(distances)
     return avg_velocity_per_frame * fps
 
+class StageTimer:
+    """
+    热路径分阶段计时
+    
+    每个阶段记录每帧耗时（批量处理的阶段按帧数平均分摊到每帧）以及累计耗时，
+    汇总为每帧耗时的 p50/p95、各阶段总耗时和有效帧率，用于判断任务是
+    解码、推理还是后处理受限。流水线模式下各阶段在不同线程中记录，读写加锁
+    
+    每帧耗时记入固定的对数直方图（1µs - 100s，每 10 倍 40 个桶，分位数相对误差约 3%），
+    另外累计帧数、总耗时和最大值；内存占用和汇总开销与视频长度无关
+    """
+    
+    # 直方图范围和精度
+    MIN_SECONDS = 1e-6
+    BINS_PER_DECADE = 40
+    NUM_BINS = 8 * BINS_PER_DECADE
+    
+    def __init__(self, stages=()):
+        self._lock = threading.Lock()
+        self._stages = {}
+        for stage in stages:
+            self._stages[stage] = self._new_stage()
+        self._start = time.perf_counter()
+    
+    @classmethod
+    def _new_stage(cls) -> Dict:
+        return {'counts': [0] * cls.NUM_BINS, 'frames': 0, 'total': 0.0, 'max': 0.0}
+    
+    @classmethod
+    def _bin(cls, seconds: float) -> int:
+        if seconds <= cls.MIN_SECONDS:
+            return 0
+        index = int(math.log10(seconds / cls.MIN_SECONDS) * cls.BINS_PER_DECADE)
+        return min(index, cls.NUM_BINS - 1)
+    
+    @classmethod
+    def _bin_value(cls, index: int) -> float:
+        """桶的代表值（桶上下界的几何中点）"""
+        return cls.MIN_SECONDS * 10 ** ((index + 0.5) / cls.BINS_PER_DECADE)
+    
+    def record(self, stage: str, seconds: float, frames: int = 1):
+        """记录一次耗时，frames 为这次处理的帧数"""
+        per_frame = seconds / frames
+        index = self._bin(per_frame)
+        with self._lock:
+            data = self._stages.get(stage)
+            if data is None:
+                data = self._stages[stage] = self._new_stage()
+            data['counts'][index] += frames
+            data['frames'] += frames
+            data['total'] += seconds
+            data['max'] = max(data['max'], per_frame)
+    
+    @classmethod
+    def _percentile(cls, counts: List[int], frames: int, q: float) -> float:
+        rank = q / 100 * frames
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if count and seen >= rank:
+                return cls._bin_value(index)
+        return 0.0
+    
+    def summary(self, frames: int = None) -> Dict:
+        """
+        汇总计时
+        
+        Args:
+            frames: 已完成的帧数，用于计算有效帧率；None 表示取记录最多的阶段的帧数
+        
+        Returns:
+            {'stages': {阶段: {'frames', 'total_seconds', 'p50_ms', 'p95_ms', 'max_ms'}},
+             'elapsed_seconds', 'frames', 'fps', 'bottleneck': 总耗时最长的阶段}
+        """
+        with self._lock:
+            snapshot = {stage: (data['counts'][:], data['frames'], data['total'], data['max'])
+                        for stage, data in self._stages.items()}
+            elapsed = time.perf_counter() - self._start
+        
+        stages = {}
+        for stage, (counts, count, total, longest) in snapshot.items():
+            # 分位数不超过实际最大值（最大值所在桶的代表值可能略大于它）
+            p50 = min(self._percentile(counts, count, 50), longest)
+            p95 = min(self._percentile(counts, count, 95), longest)
+            stages[stage] = {
+                'frames': count,
+                'total_seconds': round(total, 3),
+                'p50_ms': round(p50 * 1000, 3),
+                'p95_ms': round(p95 * 1000, 3),
+                'max_ms': round(longest * 1000, 3)
+            }
+        
+        if frames is None:
+            frames = max((s['frames'] for s in stages.values()), default=0)
+        
+        return {
+            'stages': stages,
+            'elapsed_seconds': round(elapsed, 3),
+            'frames': frames,
+            'fps': round(frames / elapsed, 2) if elapsed > 0 else 0,
+            'bottleneck': max(stages, key=lambda s: stages[s]['total_seconds']) if stages else None
+        }
+
+
 # 导出所有函数
 __all__ = [
+    'Track',
+    'StageTimer',
+    'BALL_TRACK_CAPACITY',
+    'HOOP_TRACK_CAPACITY',
     'get_device',
     'calculate_distance',
     'clean_ball_pos',
@@ -518,6 +854,9 @@ __all__ = [
     'detect_up',
     'detect_down',
     'in_hoop_region',
+    'boxes_to_array',
+    'filter_detections',
+    'detection_entries',
     'score',
     'fit_parabola',
     'predict_trajectory',
@@ -528,7 +867,10 @@ __all__ = [
     'get_video_info',
     'save_detection_results',
     'load_detection_results',
+    'file_content_hash',
     'format_time',
+    'shot_windows',
+    'merge_windows',
     'create_thumbnail',
     'compress_video',
     'validate_video_file',
@@ -1,25 +1,105 @@
 # video_processor.py - 视频处理模块
+import bisect
 import cv2
+import json
 import subprocess
 import os
 import tempfile
-from typing import List, Dict
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Tuple
 import shutil
+from utils import shot_windows, merge_windows
+
+# 片段剪辑方式：
+#   encode - 按请求的时间点精确剪辑，每个片段重新编码，拼接时再编码一次
+#   copy   - 起止点对齐到附近的关键帧，剪辑和拼接都直接复制码流，不编码
+#   smart  - 按请求的时间点精确剪辑，只重新编码起点到下一个关键帧、最后一个关键帧到终点两段，
+#            中间完整的 GOP 直接复制码流，三段以内嵌参数集的 Annex-B 码流拼接，音频整段编码一次；
+#            拼接集锦时也不编码
+CUT_MODES = ('encode', 'copy', 'smart')
+
+# smart 模式下与原视频编码格式对应的编码器，其他格式的视频整段重新编码
+SMART_ENCODERS = {'h264': 'libx264', 'hevc': 'libx265'}
+
+# 集锦生成方式：上面的剪辑方式（先剪片段再拼接），或
+#   filtergraph - 一次 FFmpeg 调用，用 trim/atrim + concat 滤镜截取所有时间窗，
+#                 原视频只解码一次、集锦只编码一次，不生成临时片段文件
+PIPELINE_MODES = CUT_MODES + ('filtergraph',)
+
+
+def extraction_plan(num_clips: int, workers: Optional[int] = None,
+                    cpu_count: Optional[int] = None) -> Tuple[int, int]:
+    """
+    并行剪辑的任务数和每个 FFmpeg 进程的线程数
+
+    x264 单进程超过 4 个线程后加速有限，默认每 4 个核运行一个 FFmpeg 进程；
+    每个进程的线程数按核数平均分配，总线程数不超过核数
+
+    Returns:
+        (并行任务数, 每个进程的线程数)
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if workers is None:
+        workers = max(1, cpu_count // 4)
+    workers = max(1, min(workers, num_clips))
+    return workers, max(1, cpu_count // workers)
+
+
+def clip_timeout(clip_duration: float) -> float:
+    """剪辑一个片段的超时时间（秒），随片段时长放宽"""
+    return max(60, clip_duration * 6)
+
+
+def snap_to_keyframes(start: float, end: float, keyframes: List[float],
+                      duration: float) -> Tuple[float, float]:
+    """
+    把片段起止时间对齐到关键帧（只会放宽，不会截短请求的范围）
+
+    起点取不晚于 start 的最后一个关键帧（复制码流只能从关键帧开始），
+    终点取不早于 end 的第一个关键帧，之后没有关键帧时取视频结尾
+
+    Args:
+        keyframes: 升序的关键帧时间（秒）
+    """
+    # 容差 1ms，避免浮点误差把恰好落在关键帧上的时间点推到相邻关键帧
+    i = bisect.bisect_right(keyframes, start + 1e-3) - 1
+    snapped_start = keyframes[i] if i >= 0 else 0.0
+
+    j = bisect.bisect_left(keyframes, end - 1e-3)
+    snapped_end = keyframes[j] if j < len(keyframes) else duration
+    return snapped_start, min(snapped_end, duration)
+
 
 class VideoProcessor:
     """
     视频剪辑和拼接处理器
     """
     
-    def __init__(self, temp_dir=None):
+    def __init__(self, temp_dir=None, cpu_count=None):
         """
         初始化视频处理器
         
         Args:
             temp_dir: 临时文件目录，如果为None则使用系统临时目录
+            cpu_count: 剪辑可使用的 CPU 核数（多个处理器同时运行时按份分配），None 表示全部
         """
         self.temp_dir = temp_dir or tempfile.gettempdir()
         os.makedirs(self.temp_dir, exist_ok=True)
+        self.cpu_count = cpu_count
+        
+        # 最近一次处理的 FFmpeg 耗时：每个片段的剪辑耗时和拼接耗时
+        self.last_timing = {'clips': [], 'extract_seconds': 0.0, 'concat_seconds': 0.0, 'render_seconds': 0.0}
+        
+        # 最近一次剪辑的片段：请求的起止时间和实际使用的起止时间（copy 模式下对齐到关键帧）
+        self.last_segments = []
+        # 最近一次剪辑实际使用的剪辑方式（smart 模式不支持的视频会改为 encode）
+        self.last_cut_mode = None
+        
+        # 关键帧时间缓存 {(视频路径, 修改时间): [秒, ...]}
+        self._keyframes = {}
+        # 音视频流参数缓存 {(视频路径, 修改时间): {'video': {...}, 'audio': {...} 或 None}}
+        self._streams = {}
         
         # 检查FFmpeg是否可用
         self._check_ffmpeg()
@@ -42,104 +122,400 @@ class VideoProcessor:
         except Exception as e:
             raise Exception(f"FFmpeg 检查失败: {str(e)}")
     
+    def probe_keyframes(self, video_path: str) -> List[float]:
+        """
+        视频流中所有关键帧的时间（秒，升序）
+        
+        时间相对于容器起点（已减去 format.start_time），与 FFmpeg 的 -ss 一致；
+        只读取包的标志位，不解码；同一文件的结果会被缓存
+        """
+        key = (os.path.abspath(video_path), os.path.getmtime(video_path))
+        if key in self._keyframes:
+            return self._keyframes[key]
+        
+        cmd = [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ]
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=120,
+            check=True
+        )
+        
+        # pts_time 是绝对时间，容器起点不为 0（如 MPEG-TS、部分手机录像）时要减去起点
+        origin = self.probe_streams(video_path)['start_time']
+        keyframes = []
+        for line in result.stdout.decode('utf-8', errors='ignore').splitlines():
+            parts = line.strip().split(',')
+            if len(parts) >= 2 and 'K' in parts[1] and parts[0] not in ('', 'N/A'):
+                keyframes.append(max(0.0, float(parts[0]) - origin))
+        keyframes.sort()
+        
+        self._keyframes[key] = keyframes
+        return keyframes
+    
+    def probe_streams(self, video_path: str) -> Dict:
+        """
+        第一路视频流和音频流的编码参数（smart 模式重新编码的片段要与原视频一致才能直接拼接）
+        
+        Returns:
+            {'video': {codec_name, profile, pix_fmt, width, height, r_frame_rate, time_base},
+             'audio': {codec_name, sample_rate, channels} 或 None,
+             'start_time': 容器起点的时间戳（秒）}
+        """
+        key = (os.path.abspath(video_path), os.path.getmtime(video_path))
+        if key in self._streams:
+            return self._streams[key]
+        
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error',
+             '-show_entries', 'stream=codec_type,codec_name,profile,pix_fmt,width,height,'
+                              'r_frame_rate,time_base,sample_rate,channels:format=start_time',
+             '-of', 'json', video_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=30,
+            check=True
+        )
+        probe = json.loads(result.stdout.decode('utf-8', errors='ignore'))
+        streams = probe.get('streams', [])
+        start_time = probe.get('format', {}).get('start_time')
+        info = {
+            'video': next((st for st in streams if st.get('codec_type') == 'video'), None),
+            'audio': next((st for st in streams if st.get('codec_type') == 'audio'), None),
+            'start_time': float(start_time) if start_time not in (None, '', 'N/A') else 0.0
+        }
+        
+        self._streams[key] = info
+        return info
+    
+    def smart_cut_supported(self, video_path: str) -> bool:
+        """原视频的编码格式能否用 smart 模式剪辑（需要有对应的编码器生成参数一致的首尾段）"""
+        video = self.probe_streams(video_path)['video']
+        return video is not None and video.get('codec_name') in SMART_ENCODERS
+    
+    def has_audio(self, video_path: str) -> bool:
+        """视频是否包含音频流"""
+        return self.probe_streams(video_path)['audio'] is not None
+    
+    @staticmethod
+    def _video_duration(video_path: str) -> float:
+        """视频时长（秒）"""
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
+        cap.release()
+        return duration
+    
     def extract_clips(self, video_path: str, timestamps: List[Dict], 
                      before: float = 8, after: float = 2, 
-                     progress_callback=None) -> List[str]:
+                     progress_callback=None, mode: str = 'encode',
+                     workers: Optional[int] = None, merge_gap: Optional[float] = 0.0) -> List[str]:
         """
         提取每个进球的视频片段
         
+        多个片段在线程池中并行剪辑（每个线程运行一个 FFmpeg 进程），
+        返回的片段顺序与进球顺序一致
+        
         Args:
             video_path: 原始视频路径
             timestamps: 进球时间戳列表 [{'frame': x, 'timestamp': y, 'made': True}, ...]
             before: 进球前保留的秒数
             after: 进球后保留的秒数
-            progress_callback: 进度回调函数
+            progress_callback: 进度回调函数 (已完成片段数, 片段总数)，每完成一个片段调用一次
+            mode: 剪辑方式，见 CUT_MODES；'copy' 时片段起止点对齐到关键帧，
+                实际使用的起止时间记录在 self.last_segments；'smart' 精确剪辑，只编码两端不完整的 GOP
+            workers: 同时运行的 FFmpeg 进程数，None 表示按 CPU 核数自动选择，见 extraction_plan
+            merge_gap: 重叠或间隔不超过该秒数的进球时间窗合并为一个片段（self.last_segments 中的
+                'shots' 为该片段包含的进球），None 表示每个进球单独一个片段
         
         Returns:
             剪辑文件路径列表
         """
+        if mode not in CUT_MODES:
+            raise ValueError(f"不支持的剪辑方式: {mode}")
+        
         # 只处理进球的片段
         made_shots = [ts for ts in timestamps if ts.get('made', False)]
         
+        self.last_segments = []
         if not made_shots:
             print("⚠️  没有检测到进球，无法生成集锦")
             return []
         
-        print(f"开始提取 {len(made_shots)} 个进球片段...")
+        if mode == 'smart' and not self.smart_cut_supported(video_path):
+            print("⚠️  视频编码格式不支持 smart 模式，改为重新编码剪辑")
+            mode = 'encode'
+        self.last_cut_mode = mode
         
-        # 获取视频信息
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps
-        cap.release()
+        duration = self._video_duration(video_path)
+        # 关键帧在提交任务前探测好，工作线程直接使用缓存
+        keyframes = self.probe_keyframes(video_path) if mode in ('copy', 'smart') else None
         
-        clips = []
+        # 每段: (实际开始, 实际结束, [(请求的开始, 请求的结束, 包含的进球), ...])
+        planned = []
+        for requested_start, requested_end, shots in shot_windows(made_shots, before, after, duration, merge_gap):
+            if mode == 'copy' and keyframes:
+                start_time, end_time = snap_to_keyframes(requested_start, requested_end, keyframes, duration)
+            else:
+                start_time, end_time = requested_start, requested_end
+            planned.append((start_time, end_time, [(requested_start, requested_end, shots)]))
         
-        for idx, shot in enumerate(made_shots):
-            # 计算剪辑时间
-            shot_time = shot['timestamp']
-            start_time = max(0, shot_time - before)
-            end_time = min(duration, shot_time + after)
-            clip_duration = end_time - start_time
-            
-            # 生成临时文件名
-            clip_filename = f"clip_{idx:03d}_{shot['frame']}.mp4"
-            clip_path = os.path.join(self.temp_dir, clip_filename)
-            
-            print(f"  提取片段 {idx + 1}/{len(made_shots)}: "
-                  f"{start_time:.2f}s - {end_time:.2f}s "
-                  f"(时长: {clip_duration:.2f}s)")
-            
-            try:
-                # 使用FFmpeg精确剪辑
-                # -ss 放在 -i 前面可以加快处理速度（快速定位）
-                # -accurate_seek 确保精确定位
-                cmd = [
-                    'ffmpeg',
-                    '-y',  # 覆盖已存在的文件
-                    '-ss', str(start_time),  # 开始时间
-                    '-i', video_path,  # 输入文件
-                    '-t', str(clip_duration),  # 持续时间
-                    '-c:v', 'libx264',  # 视频编码器
-                    '-preset', 'medium',  # 编码速度
-                    '-crf', '23',  # 质量（18-28，值越小质量越高）
-                    '-c:a', 'aac',  # 音频编码器
-                    '-b:a', '128k',  # 音频比特率
-                    '-avoid_negative_ts', 'make_zero',  # 避免时间戳问题
-                    clip_path
-                ]
-                
-                result = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=60,  # 超时设置
-                    check=True
-                )
+        if mode == 'copy' and merge_gap is not None:
+            # 对齐到关键帧后时间窗变宽，相邻片段可能重新重叠
+            planned = merge_windows(planned, merge_gap)
+        
+        segments = []
+        for idx, (start_time, end_time, parts) in enumerate(planned):
+            shots = [shot for _, _, part_shots in parts for shot in part_shots]
+            segments.append({
+                'index': idx,
+                'frame': shots[0]['frame'],
+                'requested_start': round(min(part[0] for part in parts), 3),
+                'requested_end': round(max(part[1] for part in parts), 3),
+                'start': round(start_time, 3),
+                'end': round(end_time, 3),
+                'shots': shots,
+                # 生成临时文件名
+                'path': os.path.join(self.temp_dir, f"clip_{idx:03d}_{shots[0]['frame']}.mp4")
+            })
+        
+        workers, threads = extraction_plan(len(segments), workers, self.cpu_count)
+        print(f"开始提取 {len(made_shots)} 个进球的 {len(segments)} 个片段（{mode}），"
+              f"{workers} 个并行任务，每个 FFmpeg 进程 {threads} 个线程...")
+        
+        def extract(segment):
+            clip_start = time.perf_counter()
+            clip_duration = segment['end'] - segment['start']
+            error = self._extract_clip(video_path, segment['path'], segment['start'], clip_duration,
+                                       mode, threads)
+            if error is None and not (os.path.exists(segment['path']) and os.path.getsize(segment['path']) > 0):
+                error = '生成失败'
+            return error, time.perf_counter() - clip_start
+        
+        clip_timings = [None] * len(segments)
+        self.last_timing['clips'] = clip_timings
+        extract_start = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(extract, segment): segment for segment in segments}
+            for completed, future in enumerate(as_completed(futures), start=1):
+                segment = futures[future]
+                idx = segment['index']
+                error, seconds = future.result()
                 
-                # 验证文件是否生成
-                if os.path.exists(clip_path) and os.path.getsize(clip_path) > 0:
-                    clips.append(clip_path)
-                    print(f"    ✓ 片段 {idx + 1} 提取成功")
+                if error is None:
+                    print(f"  ✓ 片段 {idx + 1}/{len(segments)} 提取成功: "
+                          f"{segment['start']:.2f}s - {segment['end']:.2f}s ({seconds:.1f}s)")
                 else:
-                    print(f"    ✗ 片段 {idx + 1} 生成失败")
+                    print(f"  ✗ 片段 {idx + 1}/{len(segments)} {error}")
+                    segment['path'] = None
+                
+                clip_timings[idx] = {
+                    'index': idx,
+                    'duration': round(segment['end'] - segment['start'], 2),
+                    'seconds': round(seconds, 3),
+                    'success': error is None
+                }
                 
-                # 进度回调
+                # 进度回调（按完成顺序）
                 if progress_callback:
-                    progress_callback(idx + 1, len(made_shots))
-                    
-            except subprocess.TimeoutExpired:
-                print(f"    ✗ 片段 {idx + 1} 处理超时")
-            except subprocess.CalledProcessError as e:
-                print(f"    ✗ 片段 {idx + 1} FFmpeg错误: {e.stderr.decode()[:200]}")
-            except Exception as e:
-                print(f"    ✗ 片段 {idx + 1} 未知错误: {str(e)}")
+                    progress_callback(completed, len(segments))
+        
+        self.last_segments = segments
+        clips = [segment['path'] for segment in segments if segment['path']]
         
-        print(f"✓ 成功提取 {len(clips)}/{len(made_shots)} 个片段")
+        self.last_timing['extract_seconds'] = round(time.perf_counter() - extract_start, 3)
+        print(f"✓ 成功提取 {len(clips)}/{len(segments)} 个片段，"
+              f"FFmpeg 耗时 {self.last_timing['extract_seconds']}s")
         return clips
     
+    def _extract_clip(self, video_path: str, clip_path: str, start_time: float,
+                      clip_duration: float, mode: str, threads: int = 0) -> Optional[str]:
+        """
+        用 FFmpeg 剪辑一个片段
+        
+        Args:
+            threads: FFmpeg 线程数，0 表示由 FFmpeg 自动选择
+        
+        Returns:
+            None 表示成功，否则为错误描述
+        """
+        if mode == 'smart':
+            return self._smart_cut(video_path, clip_path, start_time, clip_duration, threads)
+        
+        # -ss 放在 -i 前面可以加快处理速度（快速定位）
+        cmd = [
+            'ffmpeg',
+            '-y',  # 覆盖已存在的文件
+            '-ss', str(start_time),  # 开始时间
+            '-i', video_path,  # 输入文件
+            '-t', str(clip_duration)  # 持续时间
+        ]
+        if mode == 'copy':
+            # 起点已对齐到关键帧，直接复制码流
+            cmd += ['-c', 'copy']
+        else:
+            cmd += [
+                '-c:v', 'libx264',  # 视频编码器
+                '-preset', 'medium',  # 编码速度
+                '-crf', '23',  # 质量（18-28，值越小质量越高）
+                '-c:a', 'aac',  # 音频编码器
+                '-b:a', '128k',  # 音频比特率
+                '-threads', str(threads)
+            ]
+        cmd += [
+            '-avoid_negative_ts', 'make_zero',  # 避免时间戳问题
+            clip_path
+        ]
+        return self._run_ffmpeg(cmd, clip_timeout(clip_duration))
+    
+    @staticmethod
+    def _run_ffmpeg(cmd: List[str], timeout: float = 60) -> Optional[str]:
+        """运行 FFmpeg，返回 None 表示成功，否则为错误描述"""
+        try:
+            subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                timeout=timeout,  # 超时设置
+                check=True
+            )
+            return None
+        except subprocess.TimeoutExpired:
+            return "处理超时"
+        except subprocess.CalledProcessError as e:
+            return f"FFmpeg错误: {e.stderr.decode()[:200]}"
+        except Exception as e:
+            return f"未知错误: {str(e)}"
+    
+    def _smart_cut(self, video_path: str, clip_path: str, start_time: float,
+                   clip_duration: float, threads: int = 0) -> Optional[str]:
+        """
+        精确剪辑，只重新编码两端不完整的 GOP
+        
+        视频分为三段：起点到其后第一个关键帧（编码）、中间完整的 GOP（复制码流）、
+        最后一个关键帧到终点（编码）。各段先输出为只含视频的 MPEG-TS（Annex-B），
+        参数集随码流内嵌在关键帧前：复制段经 *_mp4toannexb 带上原视频的 SPS/PPS，
+        H.264 编码段使用不同的 SPS/PPS id，拼接后解码器不会用编码段的参数集解码复制段。
+        三段用 concat demuxer 直接复制拼接，再封装为 MP4；音频对整个片段只编码一次，
+        避免每段 AAC 编码的前后填充在拼接处留下空隙
+        
+        Returns:
+            None 表示成功，否则为错误描述
+        """
+        streams = self.probe_streams(video_path)
+        video, audio = streams['video'], streams['audio']
+        codec = video['codec_name']
+        encoder = SMART_ENCODERS[codec]
+        
+        numerator, denominator = video.get('r_frame_rate', '25/1').split('/')
+        frame_time = int(denominator) / int(numerator) if int(numerator) else 0.04
+        end_time = start_time + clip_duration
+        
+        # 片段内的第一个和最后一个关键帧
+        keyframes = self.probe_keyframes(video_path)
+        i = bisect.bisect_left(keyframes, start_time - 1e-3)
+        j = bisect.bisect_right(keyframes, end_time + 1e-3) - 1
+        if i >= len(keyframes) or j < i or keyframes[j] - keyframes[i] < frame_time:
+            # 片段内没有完整的 GOP，整段按相同参数编码
+            pieces = [('encode', start_time, end_time)]
+        else:
+            # 不足一帧的首尾段直接省略
+            inner_start, inner_end = keyframes[i], keyframes[j]
+            pieces = []
+            if inner_start - start_time >= frame_time:
+                pieces.append(('encode', start_time, inner_start))
+            pieces.append(('copy', inner_start, inner_end))
+            if end_time - inner_end >= frame_time:
+                pieces.append(('encode', inner_end, end_time))
+        
+        # 所有段使用与原视频相同的时间基和音频参数
+        mux_args = ['-video_track_timescale', video.get('time_base', '1/90000').split('/')[1]]
+        if audio:
+            audio_args = ['-c:a', 'aac', '-b:a', '128k',
+                          '-ar', str(audio.get('sample_rate', 44100)), '-ac', str(audio.get('channels', 2))]
+        else:
+            audio_args = ['-an']
+        
+        encode_args = ['-c:v', encoder, '-preset', 'medium', '-crf', '23', '-pix_fmt', video.get('pix_fmt', 'yuv420p'),
+                       '-threads', str(threads)]
+        profile = (video.get('profile') or '').lower().replace('constrained ', '')
+        profile = profile.replace(' 4:2:2', '422').replace(' 4:4:4 predictive', '444').replace(' ', '')
+        if profile:
+            encode_args += ['-profile:v', profile]
+        
+        if len(pieces) == 1 and pieces[0][0] == 'encode':
+            # 只有一段时直接输出为片段文件
+            return self._run_ffmpeg([
+                'ffmpeg', '-y',
+                '-ss', str(start_time),
+                '-i', video_path,
+                '-t', str(clip_duration)
+            ] + encode_args + audio_args + mux_args + ['-avoid_negative_ts', 'make_zero', clip_path],
+                clip_timeout(clip_duration))
+        
+        # 编码段的参数集写在码流内：H.264 换用 SPS/PPS id 1 与原视频区分，HEVC 在每个关键帧前重复参数集
+        if codec == 'h264':
+            encode_args += ['-x264-params', 'sps-id=1']
+        else:
+            encode_args += ['-x265-params', 'repeat-headers=1']
+        
+        stem = os.path.splitext(clip_path)[0]
+        piece_paths = []
+        list_file = f"{stem}_parts.txt"
+        try:
+            for idx, (kind, piece_start, piece_end) in enumerate(pieces):
+                piece_path = f"{stem}_part{idx}.ts"
+                piece_paths.append(piece_path)
+                cmd = [
+                    'ffmpeg', '-y',
+                    '-ss', str(piece_start),
+                    '-i', video_path,
+                    '-t', str(piece_end - piece_start),
+                    '-map', '0:v:0'
+                ]
+                if kind == 'copy':
+                    cmd += ['-c:v', 'copy', '-bsf:v', f"{codec}_mp4toannexb"]
+                else:
+                    cmd += encode_args
+                cmd += ['-an', '-avoid_negative_ts', 'make_zero', '-f', 'mpegts', piece_path]
+                
+                error = self._run_ffmpeg(cmd, clip_timeout(piece_end - piece_start))
+                if error:
+                    return error
+            
+            with open(list_file, 'w', encoding='utf-8') as f:
+                for piece_path in piece_paths:
+                    abs_path = os.path.abspath(piece_path).replace('\\', '/')
+                    f.write(f"file '{abs_path}'\n")
+            
+            # 拼接视频段，同时从原视频截取整个片段的音频一次编码
+            cmd = [
+                'ffmpeg', '-y',
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', list_file
+            ]
+            if audio:
+                cmd += ['-ss', str(start_time), '-t', str(clip_duration), '-i', video_path,
+                        '-map', '0:v:0', '-map', '1:a:0']
+            cmd += ['-c:v', 'copy'] + audio_args + mux_args + ['-avoid_negative_ts', 'make_zero', clip_path]
+            return self._run_ffmpeg(cmd, clip_timeout(clip_duration))
+        finally:
+            for path in piece_paths + [list_file]:
+                if os.path.exists(path):
+                    os.remove(path)
+    
     def concatenate_clips(self, clips: List[str], output_path: str,
-                         add_transitions: bool = False) -> bool:
+                         add_transitions: bool = False, stream_copy: bool = False) -> bool:
         """
         拼接所有视频片段
         
@@ -147,6 +523,7 @@ class VideoProcessor:
             clips: 片段文件路径列表
             output_path: 输出文件路径
             add_transitions: 是否添加转场效果（淡入淡出）
+            stream_copy: 直接复制码流、不重新编码（片段须来自同一视频或编码参数相同）
         
         Returns:
             是否成功
@@ -156,6 +533,7 @@ class VideoProcessor:
             return False
         
         print(f"\n开始拼接 {len(clips)} 个片段...")
+        concat_start = time.perf_counter()
         
         # 创建文件列表
         list_file = os.path.join(self.temp_dir, 'concat_list.txt')
@@ -200,14 +578,19 @@ class VideoProcessor:
                 '-y',
                 '-f', 'concat',  # 使用concat demuxer
                 '-safe', '0',  # 允许使用绝对路径
-                '-i', list_file,
-                '-c:v', 'libx264',  # 重新编码视频
-                '-preset', 'medium',
-                '-crf', '23',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                output_path
+                '-i', list_file
             ]
+            if stream_copy:
+                cmd += ['-c', 'copy']
+            else:
+                cmd += [
+                    '-c:v', 'libx264',  # 重新编码视频
+                    '-preset', 'medium',
+                    '-crf', '23',
+                    '-c:a', 'aac',
+                    '-b:a', '128k'
+                ]
+            cmd.append(output_path)
             
             print("  执行拼接...")
             print(f"  FFmpeg命令: {' '.join(cmd)}")
@@ -250,10 +633,108 @@ class VideoProcessor:
             traceback.print_exc()
             return False
         finally:
+            self.last_timing['concat_seconds'] = round(time.perf_counter() - concat_start, 3)
+            
             # 清理文件列表
             if os.path.exists(list_file):
                 os.remove(list_file)
     
+    def render_highlight(self, video_path: str, timestamps: List[Dict], output_path: str,
+                         before: float = 8, after: float = 2, merge_gap: Optional[float] = 0.0) -> bool:
+        """
+        单次 FFmpeg 调用生成集锦
+        
+        用 trim/atrim 截出每个进球的时间窗，concat 滤镜拼接后只编码一次，
+        编码参数与 extract_clips + concatenate_clips 相同；不生成临时片段文件。
+        读取在最后一个时间窗结束处停止。时间窗的合并与 extract_clips 相同（merge_gap）
+        
+        Returns:
+            是否成功
+        """
+        made_shots = [ts for ts in timestamps if ts.get('made', False)]
+        
+        self.last_segments = []
+        if not made_shots:
+            print("⚠️  没有检测到进球，无法生成集锦")
+            return False
+        
+        duration = self._video_duration(video_path)
+        windows = shot_windows(made_shots, before, after, duration, merge_gap)
+        audio = self.has_audio(video_path)
+        
+        # 解码后的流用 split/asplit 分给每个时间窗，各自 trim（和 atrim）、时间戳归零后按顺序送入 concat
+        count = len(windows)
+        filters = [f"[0:v]split={count}" + ''.join(f"[sv{idx}]" for idx in range(count))]
+        if audio:
+            filters.append(f"[0:a]asplit={count}" + ''.join(f"[sa{idx}]" for idx in range(count)))
+        inputs = []
+        for idx, (start_time, end_time, _) in enumerate(windows):
+            filters.append(f"[sv{idx}]trim=start={start_time:.3f}:end={end_time:.3f},"
+                           f"setpts=PTS-STARTPTS[v{idx}]")
+            inputs.append(f"[v{idx}]")
+            if audio:
+                filters.append(f"[sa{idx}]atrim=start={start_time:.3f}:end={end_time:.3f},"
+                               f"asetpts=PTS-STARTPTS[a{idx}]")
+                inputs.append(f"[a{idx}]")
+        outputs = '[outv][outa]' if audio else '[outv]'
+        filters.append(f"{''.join(inputs)}concat=n={count}:v=1:a={int(audio)}{outputs}")
+        
+        read_until = max(end_time for _, end_time, _ in windows)
+        cmd = [
+            'ffmpeg',
+            '-y',
+            '-t', f"{read_until:.3f}",  # 输入选项：读到最后一个时间窗结束为止
+            '-i', video_path,
+            '-filter_complex', ';'.join(filters),
+            '-map', '[outv]',
+            '-c:v', 'libx264',
+            '-preset', 'medium',
+            '-crf', '23'
+        ]
+        if audio:
+            cmd += ['-map', '[outa]', '-c:a', 'aac', '-b:a', '128k']
+        cmd.append(output_path)
+        
+        print(f"单次渲染 {len(made_shots)} 个进球的 {len(windows)} 个片段...")
+        render_start = time.perf_counter()
+        try:
+            subprocess.run(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                # 需要解码到最后一个时间窗，超时随视频长度放宽
+                timeout=max(300, read_until * 2),
+                check=True
+            )
+        except subprocess.TimeoutExpired:
+            print("✗ 渲染超时")
+            return False
+        except subprocess.CalledProcessError as e:
+            print(f"✗ FFmpeg渲染错误: {e.stderr.decode('utf-8', errors='ignore')[-500:]}")
+            return False
+        finally:
+            self.last_timing['render_seconds'] = round(time.perf_counter() - render_start, 3)
+        
+        self.last_segments = [{
+            'index': idx,
+            'frame': shots[0]['frame'],
+            'requested_start': round(start_time, 3),
+            'requested_end': round(end_time, 3),
+            'start': round(start_time, 3),
+            'end': round(end_time, 3),
+            'shots': shots,
+            'path': None
+        } for idx, (start_time, end_time, shots) in enumerate(windows)]
+        
+        if not (os.path.exists(output_path) and os.path.getsize(output_path) > 0):
+            print("✗ 渲染失败：输出文件无效")
+            return False
+        
+        file_size_mb = os.path.getsize(output_path) / (1024 * 1024)
+        print(f"✓ 渲染完成: {output_path}，FFmpeg 耗时 {self.last_timing['render_seconds']}s")
+        print(f"  文件大小: {file_size_mb:.2f} MB")
+        return True
+    
     def cleanup_clips(self, clips: List[str]):
         """清理临时片段文件"""
         print("\n清理临时文件...")
@@ -269,7 +750,9 @@ class VideoProcessor:
         print(f"✓ 清理了 {cleaned}/{len(clips)} 个临时文件")
     
     def process_video_full_pipeline(self, video_path: str, timestamps: List[Dict],
-                                    output_path: str, before: float = 8, after: float = 2) -> Dict:
+                                    output_path: str, before: float = 8, after: float = 2,
+                                    mode: str = 'encode', workers: Optional[int] = None,
+                                    merge_gap: Optional[float] = 0.0) -> Dict:
         """
         完整的处理流程：检测 -> 剪辑 -> 拼接
         
@@ -279,6 +762,11 @@ class VideoProcessor:
             output_path: 输出视频路径
             before: 进球前保留秒数
             after: 进球后保留秒数
+            mode: 生成方式，见 PIPELINE_MODES；'copy' 不编码，剪辑点对齐到关键帧（比请求的范围略宽），
+                实际使用的起止时间在结果的 'segments' 中；'smart' 精确剪辑，只编码片段两端不完整的 GOP；
+                'filtergraph' 单次解码、单次编码
+            workers: 并行剪辑的 FFmpeg 进程数，None 表示自动选择
+            merge_gap: 重叠或间隔不超过该秒数的进球时间窗合并为一段，None 表示不合并
         
         Returns:
             处理结果字典
@@ -287,24 +775,43 @@ class VideoProcessor:
         print("开始完整视频处理流程")
         print("=" * 60)
         
+        self.last_timing = {'clips': [], 'extract_seconds': 0.0, 'concat_seconds': 0.0, 'render_seconds': 0.0}
         result = {
             'success': False,
             'clips_extracted': 0,
             'output_file': None,
-            'error': None
+            'error': None,
+            'timings': self.last_timing,
+            'segments': []
         }
         
         try:
+            if mode == 'filtergraph':
+                # 剪辑和拼接在同一次 FFmpeg 调用中完成
+                success = self.render_highlight(video_path, timestamps, output_path, before, after, merge_gap)
+                result['segments'] = self.last_segments
+                result['clips_extracted'] = len(self.last_segments)
+                if success:
+                    result['success'] = True
+                    result['output_file'] = output_path
+                else:
+                    result['error'] = "渲染失败"
+                return result
+            
             # 步骤1: 提取片段
-            clips = self.extract_clips(video_path, timestamps, before, after)
+            clips = self.extract_clips(video_path, timestamps, before, after, mode=mode, workers=workers,
+                                       merge_gap=merge_gap)
             result['clips_extracted'] = len(clips)
+            result['segments'] = self.last_segments
             
             if not clips:
                 result['error'] = "没有成功提取任何片段"
                 return result
             
             # 步骤2: 拼接片段
-            success = self.concatenate_clips(clips, output_path)
+            # copy 和 smart 模式的片段与原视频编码参数一致，直接复制拼接
+            success = self.concatenate_clips(clips, output_path,
+                                             stream_copy=(self.last_cut_mode in ('copy', 'smart')))
             
             if success:
                 result['success'] = True